@@ -17,15 +17,16 @@ with open('README.md', 'r') as f:
             'cerberus',
             'click',
             'pyaml',
-            'records',
             'requests',
             'simplejson',
+            'sqlalchemy',
+            'tablib',
         ],
         license='MIT',
         entry_points=dict(
             console_scripts=['vizbee=vizbee.cli:cli.main'],
         ),
-        tests_require=['responses'],
+        tests_require=['aiohttp', 'records', 'responses'],
         test_suite="vizbee.tests.suite",
         extras_require=dict(
             postgresql=['psycopg2'],
@@ -33,6 +34,7 @@ with open('README.md', 'r') as f:
             mysql=['mysqlclient'],
             redshift=['sqlalchemy-redshift'],
             sqlserver=['pyodbc'],
-            sybase=['pyodbc']
+            sybase=['pyodbc'],
+            asyncio=['aiohttp'],
         ),
     )
@@ -0,0 +1,130 @@
+import heapq
+import time
+
+from contextlib import contextmanager
+from itertools import count
+from threading import Condition
+
+from sqlalchemy.exc import OperationalError
+
+
+TIMEOUT = 30
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Admission():
+    def __init__(
+        self,
+        limit=4,
+        min_limit=1,
+        max_limit=32,
+        tolerance=2,
+        decrease=0.5,
+        smoothing=0.2,
+        timeout=TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.limit = limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.decrease = decrease
+        self.smoothing = smoothing
+        self.timeout = timeout
+        self.clock = clock
+        self.inflight = 0
+        self.waiting = []
+        self.tickets = count()
+        self.latencies = {}
+        self.decreased_at = float('-inf')
+        self.condition = Condition()
+
+    @property
+    def allowed(self):
+        return max(self.min_limit, int(self.limit))
+
+    def acquire(self, priority=0):
+        deadline = time.monotonic() + self.timeout
+
+        with self.condition:
+            ticket = (-priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+
+            while (
+                self.waiting[0] != ticket
+                or self.inflight >= self.allowed
+            ):
+                remaining = deadline - time.monotonic()
+
+                # give the scheduler thread back instead of starving the
+                # jobs of other connections
+                if remaining <= 0:
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    self.condition.notify_all()
+                    raise Overloaded(
+                        f"No query slot freed in {self.timeout} seconds"
+                    )
+
+                self.condition.wait(remaining)
+
+            heapq.heappop(self.waiting)
+            self.inflight += 1
+
+            # the next ticket in line may fit as well
+            self.condition.notify_all()
+            return self.clock()
+
+    def release(self, started, key=None, latency=None, error=False):
+        with self.condition:
+            saturated = self.waiting or self.inflight >= self.allowed
+            self.inflight -= 1
+
+            if error:
+                self.backoff(started)
+
+            elif latency is not None:
+                baseline = self.latencies.get(key, latency)
+                self.latencies[key] = (
+                    baseline + self.smoothing * (latency - baseline)
+                )
+
+                if latency > baseline * self.tolerance:
+                    self.backoff(started)
+
+                elif saturated:
+                    # one more slot per window of `limit` queries
+                    self.limit = min(
+                        self.max_limit,
+                        self.limit + 1 / self.limit,
+                    )
+
+            self.condition.notify_all()
+
+    def backoff(self, started):
+        # queries admitted before the last decrease already paid for it
+        if started <= self.decreased_at:
+            return
+
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.decreased_at = self.clock()
+
+    @contextmanager
+    def admit(self, key=None, priority=0):
+        started = self.acquire(priority)
+
+        try:
+            yield
+
+        except OperationalError:
+            self.release(started, key, error=True)
+            raise
+
+        except BaseException:
+            self.release(started, key)
+            raise
+
+        self.release(started, key, latency=self.clock() - started)
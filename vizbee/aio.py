@@ -0,0 +1,238 @@
+import asyncio
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from datetime import datetime
+from functools import partial
+
+import aiohttp
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from simplejson import dumps, loads
+
+from .app import Dataset
+from .workers import Pool
+
+
+class Response():
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return loads(self.content)
+
+
+class AsyncApp():
+    def __init__(self, app, threads=4, connections=100):
+        self.app = app
+        self.threads = threads
+        self.connections = connections
+        self.executor = None
+        self.session = None
+
+    async def open(self):
+        app = self.app
+        auth = None
+
+        if app.client_id is not None:
+            auth = aiohttp.BasicAuth(app.client_id, app.client_secret or '')
+
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.session = aiohttp.ClientSession(
+            auth=auth,
+            connector=aiohttp.TCPConnector(limit=self.connections),
+            headers={
+                'Content-type': 'application/json',
+                'Accept': 'application/json',
+            },
+        )
+
+    async def close(self):
+        await self.session.close()
+        self.executor.shutdown()
+
+    def run(self, coroutine):
+        loop = asyncio.new_event_loop()
+
+        async def run():
+            await self.open()
+
+            try:
+                return await coroutine
+
+            finally:
+                await self.close()
+
+        try:
+            return loop.run_until_complete(run())
+
+        finally:
+            loop.close()
+
+    def blocking(self, function, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, function, *args)
+
+    async def acquire(self, endpoint):
+        for bucket in self.app.rate_limiter.buckets(endpoint):
+            while True:
+                delay = bucket.wait()
+
+                if not delay:
+                    break
+
+                await asyncio.sleep(delay)
+
+    async def request(self, url, method='put', body=None):
+        endpoint = url.strip('/').split('/')[0]
+        limiter = self.app.rate_limiter
+
+        try:
+            for attempt in range(limiter.retries + 1):
+                await self.acquire(endpoint)
+
+                data = body
+
+                if isinstance(body, BytesIO):
+                    data = body.getvalue()
+
+                elif hasattr(body, 'fileno'):
+                    # aiohttp closes file payloads once sent, hand it a
+                    # duplicate so that the body can be sent again
+                    body.seek(0)
+                    data = os.fdopen(os.dup(body.fileno()), 'rb')
+
+                try:
+                    async with self.session.request(
+                        method,
+                        self.app.api_url + url,
+                        data=data,
+                        allow_redirects=False,
+                    ) as response:
+                        response = Response(
+                            response.status,
+                            response.headers,
+                            await response.read(),
+                        )
+
+                finally:
+                    if hasattr(data, 'close') and data is not body:
+                        data.close()
+
+                limiter.feedback(endpoint, response)
+
+                if response.status_code != 429:
+                    break
+
+            return response
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.app.log(
+                "Error sending request: \n{e}",
+                e=str(e),
+                level='critical',
+            )
+
+    def encode(self, dataset):
+        if self.app.pool is not None:
+            return dataset.encode()
+
+        results = dataset.execute()
+
+        if results is None:
+            return None
+
+        try:
+            return dataset.dump(results)
+
+        finally:
+            results.close()
+
+    async def push(self, item):
+        if not isinstance(item, Dataset):
+            body = dumps(item.payload, default=str).encode()
+
+        elif item.key is None:
+            started = datetime.now()
+            body = await self.blocking(self.encode, item)
+
+            if body is None:
+                return False
+
+        else:
+            # patches diff against the local snapshot, keep them blocking
+            return await self.blocking(item.push)
+
+        try:
+            item.log("Pushing: {slug}")
+            response = await self.request(item.url, body=body)
+            pushed = item.handle(response)
+
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+        if pushed and isinstance(item, Dataset):
+            item.last_run = started
+
+        return pushed
+
+    async def sync(self):
+        for collection in (self.app.datasets, self.app.dashboards):
+            pushed = await asyncio.gather(*(
+                self.push(item) for item in collection.values()
+            ))
+
+            if not all(pushed):
+                self.app.log("Sync failed", level='critical')
+                return False
+
+        return True
+
+    def start(self, sync=True, workers=0):
+        app = self.app
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        scheduler = AsyncIOScheduler(event_loop=loop)
+
+        try:
+            for dataset in app.datasets.values():
+                dataset.schedule_job(scheduler, partial(self.push, dataset))
+
+        except ValueError as e:
+            app.log(
+                str(e),
+                level='critical',
+            )
+
+        app.monitor(scheduler, lambda dataset: partial(self.push, dataset))
+
+        if workers:
+            app.pool = Pool(
+                app.connection_options,
+                workers,
+                app.budget.limit,
+                app.health,
+            )
+
+        loop.run_until_complete(self.open())
+
+        try:
+            if sync:
+                app.log("Triggering initial sync", level='info')
+                if not loop.run_until_complete(self.sync()):
+                    return False
+
+            app.log("Start processing jobs", level='info')
+            scheduler.start()
+            loop.run_forever()
+
+        finally:
+            loop.run_until_complete(self.close())
+
+            if app.pool is not None:
+                app.pool.shutdown()
+                app.pool = None
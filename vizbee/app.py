@@ -1,19 +1,33 @@
 import os
 import logging
+import time
 
 from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
 
 import click
-import records
 import requests
 
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.blocking import BlockingScheduler
 from cerberus import Validator
+from simplejson import JSONEncoder, dumps
 from sqlalchemy.exc import DatabaseError
 
 from yaml import load, dump
 from yaml.error import YAMLError
 
+from .admission import Admission, Overloaded
+from .connection import Connection
+from .health import INTERVAL, Breaker, Unavailable
+from .params import LastRun, bind, uses_last_run
+from .ratelimit import RateLimiter
+from .results import Budget, LimitExceeded, size
+from .snapshot import DuplicateKey, Snapshot
+from .tracing import tracer
+from .workers import Pool, WorkerFailed
 from .schema import schema
 
 
@@ -23,6 +37,9 @@ logger = logging.getLogger(__name__)
 API_URL = 'https://api.vizbee.io/v1'
 
 
+SNAPSHOTS = os.path.join('.vizbee', 'snapshots')
+
+
 class Item():
     @property
     def url_prefix(self):
@@ -33,19 +50,30 @@ class Item():
         kwargs.update(dict(slug=slug))
         self.app.log(message, **kwargs)
 
-    def push(self, open_=False):
-        payload = self.payload
+    @property
+    def url(self):
+        return f'/{self.url_prefix}/{self.slug}'
+
+    def push(self, open_=False, payload=None, body=None):
+        if payload is None and body is None:
+            payload = self.payload
 
         self.log("Pushing: {slug}")
 
-        response = self.app.request(
-            f'/{self.url_prefix}/{self.slug}',
-            data=payload,
-        )
+        response = self.app.request(self.url, data=payload, body=body)
+        return self.handle(response, open_)
 
+    def handle(self, response, open_=False):
         status = response.status_code
 
         if status not in (200, 201):
+            if status == 429:
+                self.log(
+                    "The server throttled {slug}, giving up",
+                    level='warning',
+                )
+                return False
+
             if status == 422:
                 json = response.json()
                 errors = json['errors']
@@ -93,6 +121,14 @@ class Dataset(Item):
         graph,
         name=None,
         schedule=None,
+        fetch_size=None,
+        server_side=None,
+        key=None,
+        params=None,
+        max_rows=None,
+        max_bytes=None,
+        memory=None,
+        priority=0,
     ):
         self.app = app
         self.slug = slug
@@ -100,32 +136,303 @@ class Dataset(Item):
         self.connection = connection
         self.graph = graph
         self.name = name
+        self.fetch_size = fetch_size
+        self.server_side = server_side
+        self.key = key
+        self.params = params or {}
+        self.runs = None
+        self.max_rows = max_rows
+        self.max_bytes = size(max_bytes)
+        self.memory = size(memory)
+        self.priority = priority
+        self.snapshot = Snapshot(
+            os.path.join(app.snapshots, f'{slug}.json')
+        )
+
+        # kept across restarts only when a param depends on it
+        if uses_last_run(self.params):
+            self.runs = LastRun(
+                os.path.join(app.snapshots, f'{slug}.last_run')
+            )
+
+        self._last_run = None
 
         if schedule is None:
             schedule = app.schedule
 
         self.schedule = schedule
 
-    @property
-    def payload(self):
-        data = self.execute().dataset.dict
-
+    def describe(self, **payload):
         return dict(
             name=self.name,
             graph=self.graph,
             query=self.query,
-            data=data,
+            **payload
+        )
+
+    @property
+    def last_run(self):
+        if self.runs is None:
+            return self._last_run
+
+        return self.runs.value
+
+    @last_run.setter
+    def last_run(self, value):
+        if self.runs is None:
+            self._last_run = value
+
+        else:
+            self.runs.value = value
+
+    def bind(self):
+        return bind(self.params, last_run=self.last_run)
+
+    @property
+    def limits(self):
+        return dict(
+            max_rows=self.max_rows,
+            max_bytes=self.max_bytes,
+            memory=self.memory,
+        )
+
+    def push(self, open_=False):
+        started = datetime.now()
+        pushed = self.upload(open_)
+
+        if pushed:
+            self.last_run = started
+
+        return pushed
+
+    def upload(self, open_=False):
+        if self.key is None and self.app.pool is not None:
+            body = self.encode()
+
+            if body is None:
+                return False
+
+            try:
+                return super().push(open_, body=body)
+
+            finally:
+                if not isinstance(body, bytes):
+                    body.close()
+
+        results = self.execute()
+
+        if results is None:
+            return False
+
+        try:
+            if self.key is None:
+                return self.push_results(results, open_)
+
+            return self.push_patch(results, open_)
+
+        finally:
+            results.close()
+
+    def push_results(self, results, open_=False):
+        body = self.dump(results)
+
+        try:
+            return super().push(open_, body=body)
+
+        finally:
+            if not isinstance(body, bytes):
+                body.close()
+
+    def push_patch(self, results, open_=False):
+        missing = set(self.key) - set(results.columns)
+
+        if missing:
+            self.log(
+                "Key columns {columns} not found in {slug}, pushing it all",
+                columns=", ".join(sorted(missing)),
+                level='warning',
+            )
+            return self.push_results(results, open_)
+
+        try:
+            patch, rows = self.snapshot.diff(results, self.key)
+
+        except DuplicateKey as e:
+            self.log(
+                "{error} in {slug}, pushing it all",
+                error=e,
+                level='warning',
+            )
+            self.snapshot.clear()
+            return self.push_results(results, open_)
+
+        if self.snapshot.rows and len(patch) < len(results):
+            pushed = self.patch(patch, open_)
+
+            if pushed is not None:
+                if pushed:
+                    self.snapshot.save(rows)
+
+                return pushed
+
+        pushed = self.push_results(results, open_)
+
+        if pushed:
+            self.snapshot.save(rows)
+
+        else:
+            self.snapshot.clear()
+
+        return pushed
+
+    def dump(self, results):
+        with tracer.span('serialize', dataset=self.slug) as span:
+            f = results.encode(self.describe(), self.app.budget)
+            span.set(bytes=f.tell())
+
+        f.seek(0)
+        return f
+
+    def patch(self, patch, open_=False):
+        self.log(
+            "Patching: {slug} (+{insert} ~{update} -{delete})",
+            insert=len(patch.insert),
+            update=len(patch.update),
+            delete=len(patch.delete),
+        )
+
+        response = self.app.request(
+            self.url,
+            method='patch',
+            data=self.describe(patch=patch.dict),
         )
 
+        # the server has no base to apply the patch to
+        if response.status_code in (404, 409, 412):
+            self.log("Patch rejected, falling back to a full push")
+            return None
+
+        pushed = self.handle(response, open_)
+
+        if not pushed:
+            self.snapshot.clear()
+
+        return pushed
+
     def execute(self):
         self.log("Executing: {slug}")
         try:
-            return self.connection.query(self.query)
+            with tracer.span(
+                'dataset.execute',
+                dataset=self.slug,
+                connection=self.connection.name,
+            ) as span, self.admit():
+                results = self.connection.query(
+                    self.query,
+                    fetch_size=self.fetch_size,
+                    server_side=self.server_side,
+                    params=self.bind(),
+                    budget=self.app.budget,
+                    **self.limits
+                )
+                span.set(rows=len(results), spilled=bool(results.spill))
+                return results
+
+        except Unavailable as e:
+            self.defer(e)
+
+        except (Overloaded, LimitExceeded) as e:
+            self.skip(e)
+
+        except DatabaseError as e:
+            self.log(str(e), level='critical')
+
+    def encode(self):
+        self.log("Executing: {slug}")
+        try:
+            self.connection.check()
+
+            with tracer.span(
+                'dataset.encode',
+                dataset=self.slug,
+                connection=self.connection.name,
+            ) as span, self.admit():
+                rows, size, body = self.app.pool.encode(self)
+                span.set(rows=rows, bytes=size)
+                return body
+
+        except Unavailable as e:
+            self.defer(e)
+
+        except (Overloaded, LimitExceeded, WorkerFailed) as e:
+            self.skip(e)
 
         except DatabaseError as e:
             self.log(str(e), level='critical')
 
-    def schedule_job(self, scheduler):
+    def admit(self):
+        return self.connection.admission.admit(self.slug, self.priority)
+
+    def defer(self, error):
+        self.log("{error}, deferring {slug}", error=error, level='warning')
+        self.connection.breaker.defer(self)
+
+    def skip(self, error):
+        self.log("{error}, skipping {slug}", error=error, level='warning')
+
+    @contextmanager
+    def stream(self, server_side=None):
+        self.log("Executing: {slug}")
+
+        if self.server_side is not None:
+            server_side = self.server_side
+
+        try:
+            with self.connection.stream(
+                self.query,
+                fetch_size=self.fetch_size,
+                server_side=server_side,
+                params=self.bind(),
+            ) as stream:
+                yield stream
+
+        except (DatabaseError, Unavailable) as e:
+            self.log(str(e), level='critical')
+
+    def dry_run(self):
+        started = time.perf_counter()
+        rows = size = 0
+        error = None
+
+        try:
+            with self.connection.stream(
+                self.query,
+                fetch_size=self.fetch_size,
+                server_side=self.server_side,
+                params=self.bind(),
+            ) as stream:
+                encode = JSONEncoder(default=str).encode
+                columns = stream.columns
+
+                for row in stream:
+                    rows += 1
+                    size += len(encode(dict(zip(columns, row))))
+
+        except DatabaseError as e:
+            error = str(getattr(e, 'orig', e))
+
+        except Unavailable as e:
+            error = str(e)
+
+        return OrderedDict(
+            dataset=self.slug,
+            time=round(time.perf_counter() - started, 3),
+            rows=rows,
+            bytes=size,
+            error=error,
+        )
+
+    def schedule_job(self, scheduler, job=None):
         schedule = self.schedule
 
         if schedule is None:
@@ -135,7 +442,16 @@ class Dataset(Item):
 
         duration, unit = schedule.split(' ')
 
-        scheduler.add_job(self.push, 'interval', **{unit: int(duration)})
+        if job is None:
+            job = self.job
+
+        scheduler.add_job(job, 'interval', **{unit: int(duration)})
+
+    def job(self):
+        with tracer.span('dataset.job', dataset=self.slug) as span:
+            pushed = self.push()
+            span.set(pushed=pushed)
+            return pushed
 
 
 class Dashboard(Item):
@@ -162,14 +478,29 @@ class App():
         self.client_secret = client_secret
         self.cli = cli
         self.daemonized = False
+        self.err = False
+        self.pool = None
 
         config = self.load_config(filename)
-        connections = config['connections']
+
+        self.connection_options = {
+            key: dict(url=options) if isinstance(options, str) else options
+            for key, options in config['connections'].items()
+        }
+
+        health = self.health = dict(config.get('health', {}))
+        self.health_interval = health.pop('interval', INTERVAL)
+        admission = config.get('admission', {})
 
         try:
             self.connections = {
-                key: records.Database(url)
-                for key, url in connections.items()
+                key: Connection(
+                    name=key,
+                    breaker=Breaker(**health),
+                    admission=Admission(**admission),
+                    **options
+                )
+                for key, options in self.connection_options.items()
             }
 
         except Exception as e:
@@ -180,6 +511,10 @@ class App():
             )
 
         self.schedule = config.get('schedule')
+        self.snapshots = config.get('snapshots', SNAPSHOTS)
+        self.rate_limiter = RateLimiter(**config.get('rate_limit', {}))
+        self.budget = Budget(size(config.get('memory')))
+        tracer.configure(**config.get('tracing', {}))
 
         datasets = OrderedDict()
 
@@ -192,6 +527,14 @@ class App():
                 dataset.get('graph'),
                 dataset.get('name'),
                 dataset.get('schedule'),
+                dataset.get('fetch_size'),
+                dataset.get('server_side'),
+                dataset.get('key'),
+                dataset.get('params'),
+                dataset.get('max_rows'),
+                dataset.get('max_bytes'),
+                dataset.get('memory'),
+                dataset.get('priority', 0),
             )
 
         self.datasets = datasets
@@ -222,7 +565,7 @@ class App():
 
         return f"\n\n{errors}"
 
-    def request(self, url, method='put', data=None):
+    def request(self, url, method='put', data=None, body=None):
         headers = {
             'Content-type': 'application/json',
             'Accept': 'application/json',
@@ -230,14 +573,50 @@ class App():
 
         from requests.exceptions import RequestException
 
+        endpoint = url.strip('/').split('/')[0]
+        limiter = self.rate_limiter
+
+        if body is None and data is not None:
+            with tracer.span('serialize', url=url) as span:
+                body = dumps(data, default=str).encode()
+                span.set(bytes=len(body))
+
         try:
-            return getattr(requests, method)(
-                self.api_url + url,
-                json=data,
-                auth=(self.client_id, self.client_secret),
-                headers=headers,
-                allow_redirects=False,
-            )
+            for attempt in range(limiter.retries + 1):
+                with tracer.span(
+                    'http.request',
+                    method=method,
+                    url=url,
+                    attempt=attempt,
+                ) as span:
+                    throttled = limiter.acquire(endpoint)
+                    data = body
+
+                    if isinstance(body, BytesIO):
+                        # shares the buffer, it is not copied
+                        data = body.getvalue()
+
+                    elif hasattr(body, 'seek'):
+                        body.seek(0)
+
+                    response = getattr(requests, method)(
+                        self.api_url + url,
+                        data=data,
+                        auth=(self.client_id, self.client_secret),
+                        headers=headers,
+                        allow_redirects=False,
+                    )
+
+                    limiter.feedback(endpoint, response)
+                    span.set(
+                        status=response.status_code,
+                        throttled=throttled,
+                    )
+
+                if response.status_code != 429:
+                    break
+
+            return response
 
         except RequestException as e:
             self.log(
@@ -292,7 +671,7 @@ class App():
             getattr(logger, level)(message)
 
         else:
-            click.echo(message)
+            click.echo(message, err=self.err)
 
         if level == 'critical':
             self.cli.exit(1)
@@ -333,8 +712,18 @@ class App():
         )
         self.request(f'/{type_}s/{slug}', method='delete')
 
-    def start(self, sync=True):
-        scheduler = BlockingScheduler()
+    def scheduler(self, workers=0):
+        if not workers:
+            return BlockingScheduler()
+
+        # enough threads to keep every worker process busy
+        return BlockingScheduler(executors=dict(
+            default=ThreadPoolExecutor(max(10, 2 * workers)),
+        ))
+
+    def start(self, sync=True, scheduler=None, workers=0):
+        if scheduler is None:
+            scheduler = self.scheduler(workers)
 
         try:
             for dataset in self.datasets.values():
@@ -346,13 +735,61 @@ class App():
                 level='critical',
             )
 
-        if sync:
-            self.log("Triggering initial sync", level='info')
-            if not self.sync():
-                return False
+        self.monitor(scheduler)
+
+        if workers:
+            self.pool = Pool(
+                self.connection_options,
+                workers,
+                self.budget.limit,
+                self.health,
+            )
+
+        try:
+            if sync:
+                self.log("Triggering initial sync", level='info')
+                if not self.sync():
+                    return False
+
+            self.log("Start processing jobs", level='info')
+            scheduler.start()
+
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def monitor(self, scheduler, job=None):
+        for connection in self.connections.values():
+            scheduler.add_job(
+                self.check,
+                'interval',
+                args=(connection, scheduler, job),
+                seconds=self.health_interval,
+                id=f'health-{connection.name}',
+            )
+
+    def check(self, connection, scheduler, job=None):
+        breaker = connection.breaker
+
+        # closed connections are pinged too, to open before jobs time out
+        if not breaker.allow():
+            return
+
+        error = connection.ping()
+
+        if error is not None:
+            self.log(
+                "Connection `{connection}` is unavailable: {error}",
+                connection=connection.name,
+                error=error,
+                level='warning',
+            )
+            return
 
-        self.log("Start processing jobs", level='info')
-        scheduler.start()
+        for dataset in breaker.resume():
+            dataset.log("Resuming: {slug}")
+            scheduler.add_job(dataset.job if job is None else job(dataset))
 
     def sync(self):
         for collection in (self.datasets, self.dashboards):
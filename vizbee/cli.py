@@ -1,9 +1,20 @@
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatch
+
 import click
 
+from simplejson import dumps
+
 from .app import (
     API_URL,
     App,
 )
+from .export import STREAMING, WRITERS, export
+from .profiler import Profiler
+from .results import Results
 
 
 @click.group()
@@ -30,8 +41,38 @@ from .app import (
     default=API_URL,
     help="The api url.",
 )
+@click.option(
+    '--profile',
+    is_flag=True,
+    help="Profile the command and print a summary.",
+)
+@click.option(
+    '--profile-output',
+    default='vizbee.prof',
+    help="The profile file path (pstats format).",
+)
+@click.option(
+    '--profile-top',
+    default=20,
+    type=click.IntRange(min=1),
+    help="The number of functions listed with --profile.",
+)
 @click.pass_context
-def cli(context, config, client_id, client_secret, api_url):
+def cli(
+    context,
+    config,
+    client_id,
+    client_secret,
+    api_url,
+    profile,
+    profile_output,
+    profile_top,
+):
+    if profile:
+        profiler = Profiler(profile_output, profile_top)
+        profiler.start()
+        context.call_on_close(profiler.report)
+
     app = App(api_url, client_id, client_secret, context, config)
     context.obj = app
 
@@ -76,20 +117,128 @@ def _push(app, type_, slug, open):
     return item.push(open)
 
 
+def _execute_all(app, pattern, jobs, report):
+    datasets = [
+        dataset for slug, dataset in app.datasets.items()
+        if fnmatch(slug, pattern)
+    ]
+
+    if not datasets:
+        app.log(
+            "No dataset matching `{pattern}`",
+            pattern=pattern,
+            level='critical',
+        )
+
+    executed_at = datetime.utcnow().isoformat()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        timings = list(executor.map(lambda d: d.dry_run(), datasets))
+
+    timings.sort(key=lambda timing: timing['time'], reverse=True)
+
+    results = Results(
+        timings[0].keys(),
+        [tuple(timing.values()) for timing in timings],
+    )
+    click.echo(results.dataset)
+
+    if report is not None:
+        with open(report, 'w') as f:
+            f.write(dumps(
+                dict(executed_at=executed_at, datasets=timings),
+                indent=4,
+            ))
+
+    if any(timing['error'] for timing in timings):
+        app.cli.exit(1)
+
+
 @dataset.command()
-@click.argument('dataset')
+@click.argument('dataset', required=False)
 @click.option('--json', is_flag=True)
+@click.option(
+    '--format',
+    'format_',
+    type=click.Choice(sorted(WRITERS)),
+    help="The output format.",
+)
+@click.option(
+    '--limit',
+    type=click.IntRange(min=0),
+    help="The maximum number of rows to output.",
+)
+@click.option(
+    '--sample',
+    type=click.FloatRange(0, 1),
+    help="The fraction of rows to output.",
+)
+@click.option(
+    '--output',
+    '-o',
+    type=click.Path(dir_okay=False, writable=True),
+    help="The output file path.",
+)
+@click.option(
+    '--all',
+    'all_',
+    is_flag=True,
+    help="Time all datasets matching DATASET (a glob, default: *).",
+)
+@click.option(
+    '--jobs',
+    '-j',
+    default=4,
+    type=click.IntRange(min=1),
+    help="The number of queries executed concurrently with --all.",
+)
+@click.option(
+    '--report',
+    type=click.Path(dir_okay=False, writable=True),
+    help="The JSON timing report file path with --all.",
+)
 @click.pass_obj
-def execute(app, dataset, json):
+def execute(
+    app,
+    dataset,
+    json,
+    format_,
+    limit,
+    sample,
+    output,
+    all_,
+    jobs,
+    report,
+):
     """Execute given dataset query."""
+    if all_:
+        return _execute_all(app, dataset or '*', jobs, report)
+
+    if dataset is None:
+        raise click.UsageError("Missing argument \"DATASET\".")
+
     dataset = app.get('dataset', dataset)
-    results = dataset.execute()
-    dataset = results.dataset
 
-    if json:
-        dataset = dataset.json
+    if format_ is None:
+        format_ = 'json' if json else 'table'
+
+    streaming = format_ in STREAMING
+
+    if output is None:
+        # keep piped output clean from log messages
+        app.err = streaming
+        f = sys.stdout
 
-    click.echo(dataset)
+    else:
+        f = open(output, 'w', newline='', buffering=1024 * 1024)
+
+    try:
+        with dataset.stream(server_side=streaming or None) as stream:
+            export(stream, f, format_, limit=limit, sample=sample)
+
+    finally:
+        if output is not None:
+            f.close()
 
 
 @dataset.command(name='list')
@@ -127,7 +276,9 @@ def dataset_edit(app, dataset, execute):
     dataset = app.get('dataset', dataset)
     dataset.query = click.edit(dataset.query, extension='.sql')
     results = dataset.execute()
-    click.echo(results.dataset)
+
+    if results is not None:
+        click.echo(results.dataset)
 
 
 @cli.group('dashboard')
@@ -169,10 +320,42 @@ def sync(app):
 
 
 @cli.command()
+@click.option(
+    '--workers',
+    '-w',
+    default=0,
+    type=click.IntRange(min=0),
+    help="The number of processes executing and encoding datasets.",
+)
+@click.option(
+    '--async',
+    'async_',
+    is_flag=True,
+    help="Run jobs on an event loop with non-blocking uploads.",
+)
+@click.option(
+    '--threads',
+    default=4,
+    type=click.IntRange(min=1),
+    help="The number of threads executing queries with --async.",
+)
 @click.pass_obj
-def start(app):
+def start(app, workers, async_, threads):
     """Start scheduler."""
-    app.start()
+    if not async_:
+        return app.start(workers=workers)
+
+    try:
+        from .aio import AsyncApp
+
+    except ImportError:
+        app.log(
+            "The async mode requires aiohttp: "
+            "python -m pip install vizbee[asyncio]",
+            level='critical',
+        )
+
+    AsyncApp(app, threads=threads).start(workers=workers)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DBAPIError
+
+from .admission import Admission
+from .health import Breaker, Unavailable
+from .results import FETCH_SIZE, Results, Stream
+from .tracing import tracer
+
+
+# Backends whose drivers honour `stream_results` with a server side
+# (named) cursor instead of buffering the whole result client side.
+SERVER_SIDE_BACKENDS = ('postgresql', 'redshift', 'mysql')
+
+
+PINGS = dict(oracle='SELECT 1 FROM DUAL')
+
+
+def limited(max_rows=None, max_bytes=None, memory=None, budget=None):
+    if budget is not None and budget.limit is not None:
+        return True
+
+    return any(limit is not None for limit in (max_rows, max_bytes, memory))
+
+
+class Connection():
+    def __init__(
+        self,
+        url,
+        fetch_size=FETCH_SIZE,
+        server_side=False,
+        name=None,
+        breaker=None,
+        admission=None,
+    ):
+        self.url = url
+        self.name = name
+        self.fetch_size = fetch_size
+        self.server_side = server_side
+
+        backend = make_url(url).get_backend_name()
+        options = dict()
+
+        if backend == 'oracle':
+            options.update(arraysize=fetch_size)
+
+        self.backend = backend
+        self.engine = create_engine(url, **options)
+        self.breaker = Breaker() if breaker is None else breaker
+        self.admission = Admission() if admission is None else admission
+
+    def connect(self):
+        try:
+            connection = self.engine.connect()
+
+        except DBAPIError:
+            self.breaker.failure()
+            raise
+
+        self.breaker.success()
+        return connection
+
+    def check(self):
+        if not self.breaker.allow():
+            raise Unavailable(f"Connection `{self.name}` is unavailable")
+
+    def ping(self):
+        try:
+            connection = self.connect()
+
+        except DBAPIError as e:
+            # already reported by connect()
+            return str(getattr(e, 'orig', e))
+
+        with connection:
+            try:
+                connection.execute(
+                    text(PINGS.get(self.backend, 'SELECT 1')),
+                )
+
+            except DBAPIError as e:
+                if e.connection_invalidated:
+                    self.breaker.failure()
+
+                return str(getattr(e, 'orig', e))
+
+    @contextmanager
+    def stream(
+        self,
+        query,
+        fetch_size=None,
+        server_side=None,
+        params=None,
+    ):
+        if fetch_size is None:
+            fetch_size = self.fetch_size
+
+        if server_side is None:
+            server_side = self.server_side
+
+        self.check()
+
+        with tracer.span('db.checkout', connection=self.name):
+            connection = self.connect()
+
+        with connection:
+            if server_side and self.backend in SERVER_SIDE_BACKENDS:
+                connection = connection.execution_options(
+                    stream_results=True,
+                    max_row_buffer=fetch_size,
+                )
+
+            with tracer.span('db.execute', connection=self.name):
+                try:
+                    cursor = connection.execute(
+                        text(query),
+                        params or {},
+                    )
+
+                except DBAPIError as e:
+                    if e.connection_invalidated:
+                        self.breaker.failure()
+
+                    raise
+
+            if self.backend == 'oracle' and cursor.returns_rows:
+                # the engine arraysize is only a default, later round-trips
+                # use the one of the dbapi cursor
+                cursor.cursor.arraysize = fetch_size
+
+            yield Stream(cursor, fetch_size)
+
+    def query(
+        self,
+        query,
+        fetch_size=None,
+        server_side=None,
+        params=None,
+        **limits
+    ):
+        # client side cursors load every row on execute, before the limits
+        # are checked
+        if limited(**limits):
+            server_side = True
+
+        with self.stream(query, fetch_size, server_side, params) as stream:
+            return Results.fetch(stream, **limits)
@@ -0,0 +1,64 @@
+import csv
+import random
+
+from itertools import islice
+
+from simplejson import JSONEncoder
+
+from .results import Results
+
+
+def select(rows, limit=None, sample=None):
+    if sample is not None:
+        rand = random.random
+        rows = (row for row in rows if rand() < sample)
+
+    if limit is not None:
+        rows = islice(rows, limit)
+
+    return rows
+
+
+def write_table(columns, rows, output):
+    output.write(f"{Results(columns, list(rows)).dataset}\n")
+
+
+def write_json(columns, rows, output):
+    output.write(f"{Results(columns, list(rows)).json}\n")
+
+
+def write_csv(columns, rows, output, delimiter=','):
+    writer = csv.writer(output, delimiter=delimiter, lineterminator='\n')
+    writer.writerow(columns)
+    writer.writerows(rows)
+
+
+def write_tsv(columns, rows, output):
+    write_csv(columns, rows, output, delimiter='\t')
+
+
+def write_ndjson(columns, rows, output):
+    encode = JSONEncoder(default=str).encode
+    write = output.write
+
+    for row in rows:
+        write(encode(dict(zip(columns, row))))
+        write('\n')
+
+
+WRITERS = dict(
+    table=write_table,
+    json=write_json,
+    csv=write_csv,
+    tsv=write_tsv,
+    ndjson=write_ndjson,
+)
+
+
+# Formats written row by row as they come off the cursor.
+STREAMING = ('csv', 'tsv', 'ndjson')
+
+
+def export(stream, output, format='table', limit=None, sample=None):
+    rows = select(stream, limit=limit, sample=sample)
+    WRITERS[format](stream.columns, rows, output)
@@ -0,0 +1,78 @@
+import time
+
+from threading import Lock
+
+
+INTERVAL = 30
+
+
+class Unavailable(Exception):
+    pass
+
+
+class Breaker():
+    def __init__(
+        self,
+        threshold=3,
+        backoff=1,
+        max_backoff=300,
+        clock=time.monotonic,
+    ):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.failures = 0
+        self.delay = backoff
+        self.retry_at = None
+        self.deferred = []
+        self.lock = Lock()
+
+    @property
+    def closed(self):
+        return self.retry_at is None
+
+    def allow(self):
+        with self.lock:
+            if self.retry_at is None:
+                return True
+
+            now = self.clock()
+
+            if now < self.retry_at:
+                return False
+
+            # half open, a single attempt goes through until it reports back
+            self.retry_at = now + self.delay
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.delay = self.backoff
+            self.retry_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+
+            if self.retry_at is not None:
+                self.delay = min(self.delay * 2, self.max_backoff)
+
+            elif self.failures < self.threshold:
+                return
+
+            self.retry_at = self.clock() + self.delay
+
+    def defer(self, item):
+        with self.lock:
+            if item not in self.deferred:
+                self.deferred.append(item)
+
+    def resume(self):
+        with self.lock:
+            if self.retry_at is not None:
+                return []
+
+            deferred, self.deferred = self.deferred, []
+            return deferred
@@ -0,0 +1,108 @@
+import os
+import re
+
+from datetime import datetime, timedelta
+
+
+TERM = (
+    r'(now|today|last_run)'
+    r'(?:\s*([+-])\s*(\d+)\s+(days|hours|minutes|seconds))?'
+)
+
+
+EXPRESSION = re.compile(f'^{TERM}$')
+
+
+# strings starting like an expression are expected to be valid ones
+PARAM = (
+    r'(?:(?!\s*(now|today|last_run)(\s*[+-]|\s+or\b|\s*$))[\s\S]*'
+    rf'|\s*{TERM}(\s+or\s+{TERM})*\s*)'
+)
+
+
+def evaluate(value, last_run=None, now=None):
+    if not isinstance(value, str):
+        return value
+
+    if now is None:
+        now = datetime.now()
+
+    matches = [
+        EXPRESSION.match(alternative.strip())
+        for alternative in value.split(' or ')
+    ]
+
+    if not all(matches):
+        return value
+
+    for match in matches:
+        base, sign, count, unit = match.groups()
+
+        if base == 'now':
+            base = now
+
+        elif base == 'today':
+            base = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        else:
+            base = last_run
+
+        if base is None:
+            continue
+
+        if sign is None:
+            return base
+
+        delta = timedelta(**{unit: int(count)})
+        return base + delta if sign == '+' else base - delta
+
+    return None
+
+
+FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def uses_last_run(params):
+    return any(
+        isinstance(value, str) and 'last_run' in value
+        for value in params.values()
+    )
+
+
+class LastRun():
+    def __init__(self, path):
+        self.path = path
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._value = datetime.strptime(f.read().strip(), FORMAT)
+
+            except FileNotFoundError:
+                pass
+
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        path = f'{self.path}.tmp'
+
+        with open(path, 'w') as f:
+            f.write(value.strftime(FORMAT))
+
+        os.replace(path, self.path)
+        self._value = value
+
+
+def bind(params, last_run=None, now=None):
+    if now is None:
+        now = datetime.now()
+
+    return {
+        key: evaluate(value, last_run=last_run, now=now)
+        for key, value in params.items()
+    }
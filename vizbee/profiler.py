@@ -0,0 +1,182 @@
+import cProfile
+import os
+import pstats
+import re
+
+from collections import OrderedDict
+
+import click
+
+from .results import Results
+
+
+# top level modules, and vizbee modules, attributed to each subsystem
+SUBSYSTEMS = OrderedDict(
+    config=('yaml', 'cerberus', 'vizbee.schema'),
+    db=(
+        'sqlalchemy',
+        'records',
+        'sqlite3',
+        'psycopg2',
+        'MySQLdb',
+        'cx_Oracle',
+        'pyodbc',
+        'vizbee.connection',
+        'vizbee.results',
+    ),
+    serialize=(
+        'simplejson',
+        'json',
+        'tablib',
+        'pickle',
+        'vizbee.export',
+        'vizbee.snapshot',
+    ),
+    http=(
+        'requests',
+        'urllib3',
+        'aiohttp',
+        'http',
+        'socket',
+        'ssl',
+        'vizbee.ratelimit',
+    ),
+)
+
+
+MODULES = {
+    module: subsystem
+    for subsystem, modules in SUBSYSTEMS.items()
+    for module in modules
+}
+
+
+def modules(function):
+    filename, line, name = function
+
+    # built-in functions only carry their module in their name
+    if filename == '~':
+        return [
+            token.lstrip('_')
+            for token in re.split(r'[^\w]+', name)
+        ]
+
+    parts = os.path.splitext(filename)[0].split(os.sep)
+    names = [part.lstrip('_') for part in parts]
+
+    if len(parts) > 1 and parts[-2] == 'vizbee':
+        names.append(f'vizbee.{parts[-1]}')
+
+    return names
+
+
+def subsystem(function):
+    # the innermost module wins, e.g. a vizbee module over site-packages
+    for module in reversed(modules(function)):
+        if module in MODULES:
+            return MODULES[module]
+
+    return 'other'
+
+
+def attribute(stats):
+    shares = {}
+
+    # builtins and generic modules take the subsystems of their callers,
+    # weighted by the time spent on behalf of each caller
+    def resolve(function, seen):
+        if function in shares:
+            return shares[function]
+
+        own = subsystem(function)
+
+        if own != 'other' or function in seen:
+            return {own: 1}
+
+        callers = stats[function][4] if function in stats else {}
+        total = sum(tottime for _, _, tottime, _ in callers.values())
+        share = {}
+
+        if not total:
+            share['other'] = 1
+
+        else:
+            for caller, (_, _, tottime, _) in callers.items():
+                for key, value in resolve(caller, seen | {function}).items():
+                    share[key] = share.get(key, 0) + value * tottime / total
+
+        shares[function] = share
+        return share
+
+    return {function: resolve(function, set()) for function in stats}
+
+
+def label(function):
+    filename, line, name = function
+
+    if filename == '~':
+        return name
+
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+
+class Profiler():
+    def __init__(self, output, top=20):
+        self.output = output
+        self.top = top
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.output)
+        return pstats.Stats(self.profile).stats
+
+    def summary(self, stats):
+        times = OrderedDict((key, 0) for key in (*SUBSYSTEMS, 'other'))
+        shares = attribute(stats)
+
+        for function, (_, _, tottime, _, _) in stats.items():
+            for key, share in shares[function].items():
+                times[key] += tottime * share
+
+        total = sum(times.values()) or 1
+
+        return Results(
+            ('subsystem', 'time', 'share'),
+            [
+                (key, round(time, 3), f'{time / total:.0%}')
+                for key, time in times.items()
+            ],
+        )
+
+    def functions(self, stats):
+        functions = sorted(
+            stats.items(),
+            key=lambda item: item[1][3],
+            reverse=True,
+        )
+
+        return Results(
+            ('function', 'subsystem', 'calls', 'tottime', 'cumtime'),
+            [
+                (
+                    label(function),
+                    subsystem(function),
+                    calls,
+                    round(tottime, 3),
+                    round(cumtime, 3),
+                )
+                for function, (_, calls, tottime, cumtime, _)
+                in functions[:self.top]
+            ],
+        )
+
+    def report(self):
+        stats = self.stop()
+
+        click.echo(f"Profile written to {self.output}", err=True)
+        click.echo(self.summary(stats).dataset, err=True)
+        click.echo(self.functions(stats).dataset, err=True)
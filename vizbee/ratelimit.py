@@ -0,0 +1,197 @@
+import time
+
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+
+def seconds(value, now=None):
+    if value is None:
+        return None
+
+    try:
+        value = float(value)
+
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+
+        except (TypeError, ValueError):
+            return None
+
+        value = (date - datetime.now(timezone.utc)).total_seconds()
+        return max(0, value)
+
+    # large values are epoch timestamps rather than delays
+    if value > 1e9:
+        value -= time.time() if now is None else now
+
+    return max(0, value)
+
+
+class TokenBucket():
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.limit = rate
+        self.rate = rate
+        self.burst = burst or max(1, rate or 1)
+        self.tokens = self.burst
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.blocked_until = 0
+        # recent acquisitions, to seed the rate of an unconfigured bucket
+        self.taken = deque(maxlen=32)
+        self.seed = None
+        self.lock = Lock()
+
+    def refill(self, now):
+        if self.rate is not None:
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+        self.updated = now
+
+    def wait(self):
+        with self.lock:
+            now = self.clock()
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            self.refill(now)
+
+            if self.rate is None:
+                self.taken.append(now)
+                return 0
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.taken.append(now)
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        waited = 0
+
+        while True:
+            delay = self.wait()
+
+            if not delay:
+                return waited
+
+            self.sleep(delay)
+            waited += delay
+
+    def block(self, delay):
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+            self.tokens = min(self.tokens, 0)
+            self.blocked_until = max(self.blocked_until, now + delay)
+
+    def observed(self):
+        if len(self.taken) < 2:
+            return None
+
+        elapsed = self.taken[-1] - self.taken[0]
+        return (len(self.taken) - 1) / elapsed if elapsed else None
+
+    def throttle(self, retry_after=None):
+        with self.lock:
+            rate = self.rate
+            observed = self.observed()
+
+            # the rate actually sent is what the server pushed back on
+            if observed is not None and (rate is None or observed < rate):
+                rate = observed
+
+            if rate is None:
+                rate = 2
+
+            if self.limit is None:
+                self.seed = rate
+
+            self.rate = max(rate / 2, 0.01)
+
+        if retry_after is not None:
+            self.block(retry_after)
+
+    def recover(self, remaining=None, reset=None):
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+
+            if remaining and reset:
+                # spread the remaining budget over the current window
+                rate = remaining / reset
+
+                if self.limit is not None:
+                    rate = min(rate, self.limit)
+
+                self.rate = max(rate, 0.01)
+
+            elif self.limit is not None:
+                self.rate = min(self.limit, self.rate + self.limit / 10)
+
+            elif self.rate is not None:
+                # unconfigured buckets keep probing upwards, without bound
+                self.rate += (self.seed or self.rate) / 10
+
+        if remaining == 0 and reset:
+            self.block(reset)
+
+
+class RateLimiter():
+    def __init__(self, rate=None, burst=None, retries=3, endpoints=None):
+        self.retries = retries
+        self.bucket = TokenBucket(rate, burst)
+        self.endpoints = {
+            endpoint: TokenBucket(**options)
+            for endpoint, options in (endpoints or {}).items()
+        }
+
+    def buckets(self, endpoint):
+        yield self.bucket
+
+        if endpoint in self.endpoints:
+            yield self.endpoints[endpoint]
+
+    def acquire(self, endpoint):
+        return sum(bucket.acquire() for bucket in self.buckets(endpoint))
+
+    def feedback(self, endpoint, response):
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = seconds(headers.get('X-RateLimit-Reset'))
+
+        if remaining is not None:
+            try:
+                remaining = int(remaining)
+
+            except ValueError:
+                remaining = None
+
+        # server feedback applies to the most specific bucket
+        bucket = self.endpoints.get(endpoint, self.bucket)
+
+        if response.status_code == 429:
+            retry_after = seconds(headers.get('Retry-After'))
+
+            if retry_after is None:
+                retry_after = 1 if reset is None else reset
+
+            bucket.throttle(retry_after)
+
+        else:
+            bucket.recover(remaining, reset)
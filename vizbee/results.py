@@ -0,0 +1,260 @@
+import pickle
+import re
+import tablib
+
+from io import BytesIO
+from sys import getsizeof
+from tempfile import TemporaryFile
+from threading import Lock
+
+from simplejson import JSONEncoder, dumps
+
+
+FETCH_SIZE = 1000
+
+
+# the bytes reserved at once by encoded payloads
+BUFFER_SIZE = 64 * 1024
+
+
+UNITS = dict(B=1, KB=1024, MB=1024 ** 2, GB=1024 ** 3)
+
+
+def size(value):
+    if value is None or isinstance(value, int):
+        return value
+
+    count, unit = re.match(r'(\d+)\s*(B|KB|MB|GB)?$', value).groups()
+    return int(count) * UNITS[unit or 'B']
+
+
+def estimate(batch):
+    row = batch[0]
+    return len(batch) * (
+        getsizeof(row) + sum(getsizeof(value) for value in row)
+    )
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+class OverBudget(Exception):
+    pass
+
+
+class Budget():
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self.lock = Lock()
+
+    def reserve(self, size):
+        with self.lock:
+            if self.limit is not None and self.used + size > self.limit:
+                return False
+
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self.lock:
+            self.used -= size
+
+
+class Buffer(BytesIO):
+    def __init__(self, budget=None):
+        super().__init__()
+        self.budget = budget
+        self.reserved = 0
+
+    def write(self, data):
+        size = self.tell() + len(data)
+
+        if self.budget is not None and size > self.reserved:
+            reserve = max(size - self.reserved, BUFFER_SIZE)
+
+            if not self.budget.reserve(reserve):
+                raise OverBudget(f"{size} bytes do not fit the budget")
+
+            self.reserved += reserve
+
+        return super().write(data)
+
+    def close(self):
+        if self.reserved:
+            self.budget.release(self.reserved)
+            self.reserved = 0
+
+        super().close()
+
+
+class Stream():
+    def __init__(self, cursor, size=FETCH_SIZE):
+        self.cursor = cursor
+        self.size = size
+        self.columns = tuple(cursor.keys()) if cursor.returns_rows else ()
+
+    def batches(self):
+        if not self.cursor.returns_rows:
+            return
+
+        while True:
+            batch = self.cursor.fetchmany(self.size)
+
+            if not batch:
+                return
+
+            yield list(map(tuple, batch))
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+
+class Results():
+    def __init__(self, columns, rows=None):
+        self.columns = tuple(columns)
+        self.rows = [] if rows is None else rows
+        self.count = len(self.rows)
+        self.size = 0
+        self.budget = None
+        self.reserved = 0
+        self.spill = None
+
+    @classmethod
+    def fetch(
+        cls,
+        stream,
+        max_rows=None,
+        max_bytes=None,
+        memory=None,
+        budget=None,
+    ):
+        results = cls(stream.columns)
+        results.budget = budget
+
+        try:
+            for batch in stream.batches():
+                results.append(batch, max_rows, max_bytes, memory)
+
+        except BaseException:
+            results.close()
+            raise
+
+        return results
+
+    def append(self, batch, max_rows=None, max_bytes=None, memory=None):
+        batch_size = estimate(batch)
+        self.count += len(batch)
+        self.size += batch_size
+
+        if max_rows is not None and self.count > max_rows:
+            raise LimitExceeded(f"More than {max_rows} rows fetched")
+
+        if max_bytes is not None and self.size > max_bytes:
+            raise LimitExceeded(f"More than {max_bytes} bytes fetched")
+
+        if self.spill is None:
+            if memory is not None and self.size > memory:
+                self.spill_rows()
+
+            elif self.budget is not None:
+                if self.budget.reserve(batch_size):
+                    self.reserved += batch_size
+
+                else:
+                    self.spill_rows()
+
+        if self.spill is None:
+            self.rows.extend(batch)
+
+        else:
+            pickle.dump(batch, self.spill, pickle.HIGHEST_PROTOCOL)
+
+    def spill_rows(self):
+        self.spill = TemporaryFile()
+
+        if self.rows:
+            pickle.dump(self.rows, self.spill, pickle.HIGHEST_PROTOCOL)
+
+        self.rows = []
+        self.release()
+
+    def release(self):
+        if self.reserved:
+            self.budget.release(self.reserved)
+            self.reserved = 0
+
+    def close(self):
+        self.release()
+
+        if self.spill is not None:
+            self.spill.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if self.spill is None:
+            yield from self.rows
+            return
+
+        self.spill.seek(0)
+
+        while True:
+            try:
+                yield from pickle.load(self.spill)
+
+            except EOFError:
+                return
+
+    def dicts(self):
+        columns = self.columns
+
+        for row in self:
+            yield dict(zip(columns, row))
+
+    def dump(self, payload, f):
+        encode = JSONEncoder(default=str).encode
+        head = dumps(payload, default=str)[:-1]
+        separator = ', ' if payload else ''
+
+        f.write(f'{head}{separator}"data": ['.encode())
+
+        for index, row in enumerate(self.dicts()):
+            if index:
+                f.write(b', ')
+
+            f.write(encode(row).encode())
+
+        f.write(b']}')
+
+    def encode(self, payload, budget=None, spill=TemporaryFile):
+        # the payload is held next to the rows, it is encoded to disk too
+        # when both do not fit the budget
+        if self.spill is None:
+            f = Buffer(budget)
+
+            try:
+                self.dump(payload, f)
+                return f
+
+            except OverBudget:
+                f.close()
+
+        f = spill()
+        self.dump(payload, f)
+        return f
+
+    @property
+    def dict(self):
+        return list(self.dicts())
+
+    @property
+    def json(self):
+        return dumps(self.dict, default=str)
+
+    @property
+    def dataset(self):
+        return tablib.Dataset(*self, headers=self.columns)
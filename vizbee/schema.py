@@ -1,9 +1,88 @@
+from .params import PARAM
+
+
 schedule = dict(
     type='string',
     regex=r'(\d+) (days|hours|minutes|seconds)',
 )
 
 
+size = dict(
+    type=['integer', 'string'],
+    regex=r'\d+\s*(B|KB|MB|GB)?',
+)
+
+
+fetch_size = dict(
+    type='integer',
+    min=1,
+)
+
+
+server_side = dict(
+    type='boolean',
+)
+
+
+bucket = dict(
+    rate=dict(
+        type='number',
+        min=0.01,
+    ),
+
+    burst=dict(
+        type='integer',
+        min=1,
+    ),
+)
+
+
+rate_limit = dict(
+    type='dict',
+    schema=dict(
+        retries=dict(
+            type='integer',
+            min=0,
+        ),
+
+        endpoints=dict(
+            type='dict',
+            keyschema=dict(
+                type='string',
+                allowed=['datasets', 'dashboards'],
+            ),
+            valueschema=dict(
+                type='dict',
+                schema=bucket,
+            ),
+        ),
+
+        **bucket
+    ),
+)
+
+
+connection = dict(
+    anyof=[
+        dict(type='string'),
+        dict(
+            type='dict',
+            schema=dict(
+                url=dict(
+                    type='string',
+                    required=True,
+                    nullable=False,
+                ),
+
+                fetch_size=fetch_size,
+
+                server_side=server_side,
+            ),
+        ),
+    ],
+)
+
+
 schema = dict(
     connections=dict(
         type='dict',
@@ -13,6 +92,7 @@ schema = dict(
             type='string',
             regex='[a-z\_]+',
         ),
+        valueschema=connection,
     ),
 
     datasets=dict(
@@ -29,6 +109,8 @@ schema = dict(
             schema=dict(
                 name=dict(type='string'),
 
+                connection=dict(type='string'),
+
                 query=dict(
                     type='string',
                     required=True,
@@ -42,6 +124,39 @@ schema = dict(
                 ),
 
                 schedule=schedule,
+
+                fetch_size=fetch_size,
+
+                server_side=server_side,
+
+                key=dict(
+                    type='list',
+                    minlength=1,
+                    schema=dict(type='string'),
+                ),
+
+                max_rows=dict(
+                    type='integer',
+                    min=1,
+                ),
+
+                max_bytes=size,
+
+                memory=size,
+
+                priority=dict(type='integer'),
+
+                params=dict(
+                    type='dict',
+                    keyschema=dict(
+                        type='string',
+                        regex='[a-z\_]+',
+                    ),
+                    valueschema=dict(
+                        type=['string', 'number', 'boolean'],
+                        regex=PARAM,
+                    ),
+                ),
             ),
         ),
     ),
@@ -70,4 +185,91 @@ schema = dict(
     ),
 
     schedule=schedule,
+
+    rate_limit=rate_limit,
+
+    snapshots=dict(type='string'),
+
+    memory=size,
+
+    health=dict(
+        type='dict',
+        schema=dict(
+            interval=dict(
+                type='number',
+                min=1,
+            ),
+
+            threshold=dict(
+                type='integer',
+                min=1,
+            ),
+
+            backoff=dict(
+                type='number',
+                min=0,
+            ),
+
+            max_backoff=dict(
+                type='number',
+                min=0,
+            ),
+        ),
+    ),
+
+    admission=dict(
+        type='dict',
+        schema=dict(
+            limit=dict(
+                type='integer',
+                min=1,
+            ),
+
+            min_limit=dict(
+                type='integer',
+                min=1,
+            ),
+
+            max_limit=dict(
+                type='integer',
+                min=1,
+            ),
+
+            tolerance=dict(
+                type='number',
+                min=1,
+            ),
+
+            timeout=dict(
+                type='number',
+                min=0,
+            ),
+        ),
+    ),
+
+    tracing=dict(
+        type='dict',
+        schema=dict(
+            file=dict(
+                type='string',
+                required=True,
+            ),
+
+            sample=dict(
+                type='number',
+                min=0,
+                max=1,
+            ),
+
+            max_bytes=dict(
+                type='integer',
+                min=1,
+            ),
+
+            backup_count=dict(
+                type='integer',
+                min=0,
+            ),
+        ),
+    ),
 )
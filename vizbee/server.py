@@ -0,0 +1,201 @@
+import random
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+
+from simplejson import dumps, loads
+
+
+def apply(rows, patch):
+    key = patch['key']
+
+    def values(row):
+        return tuple(row[column] for column in key)
+
+    index = {values(row): position for position, row in enumerate(rows)}
+    deleted = set(values(row) for row in patch['delete'])
+
+    for row in patch['update']:
+        rows[index[values(row)]] = row
+
+    rows = [row for row in rows if values(row) not in deleted]
+    return rows + patch['insert']
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, json=None, headers=None):
+        body = b'' if json is None else dumps(json).encode()
+
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-length', str(len(body)))
+
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.standin.count(status)
+
+    def read(self):
+        length = int(self.headers.get('Content-length') or 0)
+
+        if not length:
+            return None
+
+        return loads(self.rfile.read(length))
+
+    def route(self):
+        standin = self.server.standin
+
+        if standin.latency:
+            time.sleep(standin.latency)
+
+        if random.random() < standin.throttle_rate:
+            return self.respond(
+                429,
+                json=dict(errors='Too many requests'),
+                headers={'Retry-After': str(standin.retry_after)},
+            )
+
+        if random.random() < standin.error_rate:
+            return self.respond(500)
+
+        parts = self.path.lstrip('/').split('/')
+
+        if len(parts) != 2 or parts[0] not in standin.items:
+            return self.respond(404)
+
+        return parts
+
+    def do_GET(self):
+        parts = self.route()
+
+        if parts is None:
+            return
+
+        type_, slug = parts
+        items = self.server.standin.items[type_]
+
+        if not slug:
+            return self.respond(
+                200,
+                json=[dict(slug=slug) for slug in sorted(items)],
+            )
+
+        if slug not in items:
+            return self.respond(404)
+
+        self.respond(200, json=items[slug])
+
+    def do_PUT(self):
+        parts = self.route()
+
+        if parts is None:
+            return
+
+        type_, slug = parts
+        items = self.server.standin.items[type_]
+        status = 200 if slug in items else 201
+
+        with self.server.standin.lock:
+            items[slug] = self.read()
+
+        self.respond(status, json=dict(url=f'/{type_}/{slug}'))
+
+    def do_PATCH(self):
+        parts = self.route()
+
+        if parts is None:
+            return
+
+        type_, slug = parts
+        standin = self.server.standin
+        payload = self.read()
+
+        with standin.lock:
+            item = standin.items[type_].get(slug)
+
+            try:
+                data = apply(item['data'], payload.pop('patch'))
+
+            except (KeyError, TypeError):
+                item = None
+
+            else:
+                item.update(payload, data=data)
+
+        if item is None:
+            return self.respond(409)
+
+        self.respond(200, json=dict(url=f'/{type_}/{slug}'))
+
+    def do_DELETE(self):
+        parts = self.route()
+
+        if parts is None:
+            return
+
+        type_, slug = parts
+
+        with self.server.standin.lock:
+            self.server.standin.items[type_].pop(slug, None)
+
+        self.respond(204)
+
+
+class StandInServer():
+    def __init__(
+        self,
+        host='127.0.0.1',
+        port=0,
+        latency=0,
+        error_rate=0,
+        throttle_rate=0,
+        retry_after=1,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+        self.lock = Lock()
+        self.statuses = Counter()
+        self.items = dict(datasets=dict(), dashboards=dict())
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.standin = self
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, status):
+        with self.lock:
+            self.statuses[status] += 1
+
+    def start(self):
+        thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,106 @@
+import os
+
+from hashlib import blake2b
+
+from simplejson import dumps, load
+
+
+def digest(values):
+    data = dumps(values, default=str).encode()
+    return blake2b(data, digest_size=8).hexdigest()
+
+
+class DuplicateKey(Exception):
+    pass
+
+
+class Patch():
+    def __init__(self, key, columns):
+        self.key = key
+        self.columns = columns
+        self.insert = []
+        self.update = []
+        self.delete = []
+
+    def __len__(self):
+        return len(self.insert) + len(self.update) + len(self.delete)
+
+    @property
+    def dict(self):
+        columns = self.columns
+
+        return dict(
+            key=self.key,
+            insert=[dict(zip(columns, row)) for row in self.insert],
+            update=[dict(zip(columns, row)) for row in self.update],
+            delete=[dict(zip(self.key, values)) for values in self.delete],
+        )
+
+
+class Snapshot():
+    def __init__(self, path):
+        self.path = path
+        self._rows = None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self._rows = load(f)
+
+            except FileNotFoundError:
+                self._rows = {}
+
+        return self._rows
+
+    def diff(self, results, key):
+        columns = results.columns
+        indexes = [columns.index(column) for column in key]
+        previous = self.rows
+        patch = Patch(key, columns)
+        rows = {}
+
+        for row in results:
+            values = [row[index] for index in indexes]
+            key_hash = digest(values)
+            row_hash = digest(row)
+
+            if key_hash in rows:
+                raise DuplicateKey(
+                    f"Duplicate key {dict(zip(key, values))}"
+                )
+
+            rows[key_hash] = [values, row_hash]
+
+            if key_hash not in previous:
+                patch.insert.append(row)
+
+            elif previous[key_hash][1] != row_hash:
+                patch.update.append(row)
+
+        patch.delete = [
+            values for key_hash, (values, _) in previous.items()
+            if key_hash not in rows
+        ]
+
+        return patch, rows
+
+    def save(self, rows):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        path = f'{self.path}.tmp'
+
+        with open(path, 'w') as f:
+            f.write(dumps(rows, default=str))
+
+        os.replace(path, self.path)
+        self._rows = rows
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+
+        except FileNotFoundError:
+            pass
+
+        self._rows = None
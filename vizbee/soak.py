@@ -0,0 +1,285 @@
+import logging
+import os
+import resource
+import sqlite3
+import time
+
+from tempfile import mkdtemp
+from threading import Lock, Thread
+
+import click
+
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+from simplejson import dumps
+from yaml import dump
+
+from .app import App
+from .server import StandInServer
+
+
+def slug(index):
+    letters = ''
+
+    while True:
+        index, rest = divmod(index, 26)
+        letters = chr(ord('a') + rest) + letters
+
+        if not index:
+            return f'dataset-{letters}'
+
+        index -= 1
+
+
+def generate(directory, datasets, rows, schedule):
+    database = os.path.join(directory, 'soak.db')
+    filename = os.path.join(directory, '.vizbee.yml')
+
+    db = sqlite3.connect(database)
+    db.execute(
+        "create table events(id integer primary key, bucket text, value real);"
+    )
+    db.executemany(
+        "insert into events(id, bucket, value) values (?, ?, ?);",
+        ((i, f'day-{i % 30}', i * 0.5) for i in range(rows)),
+    )
+    db.commit()
+    db.close()
+
+    config = dict(
+        connections=dict(default=f'sqlite:///{database}'),
+        schedule=schedule,
+        datasets={
+            slug(index): dict(query=" ".join([
+                "select bucket, count(*) as count, sum(value) as total",
+                "from events",
+                f"where id % {datasets} = {index}",
+                "group by bucket;",
+            ]))
+            for index in range(datasets)
+        },
+    )
+
+    with open(filename, 'w') as f:
+        dump(config, f, default_flow_style=False)
+
+    return filename
+
+
+def rss():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+            return pages * resource.getpagesize()
+
+    except (OSError, IndexError, ValueError):
+        # `ru_maxrss` is the peak resident size, in kilobytes on linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return round(values[index], 3)
+
+
+def slope(samples):
+    if len(samples) < 2:
+        return 0
+
+    count = len(samples)
+    mean_x = sum(x for x, _ in samples) / count
+    mean_y = sum(y for _, y in samples) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in samples)
+
+    if not variance:
+        return 0
+
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in samples)
+    return covariance / variance
+
+
+class Stats():
+    def __init__(self):
+        self.lock = Lock()
+        self.pushes = 0
+        self.failures = 0
+        self.errors = 0
+        self.missed = 0
+        self.skipped = 0
+        self.lags = []
+        self.latencies = []
+        self.memory = []
+
+    def listen(self, event):
+        now = time.time()
+
+        # connection health checks are not pushes
+        if event.job_id.startswith('health-'):
+            return
+
+        with self.lock:
+            if event.code == EVENT_JOB_SUBMITTED:
+                for run_time in event.scheduled_run_times:
+                    self.lags.append(now - run_time.timestamp())
+
+            elif event.code == EVENT_JOB_EXECUTED:
+                self.latencies.append(
+                    now - event.scheduled_run_time.timestamp()
+                )
+
+                if event.retval:
+                    self.pushes += 1
+
+                else:
+                    self.failures += 1
+
+            elif event.code == EVENT_JOB_ERROR:
+                self.errors += 1
+
+            elif event.code == EVENT_JOB_MISSED:
+                self.missed += 1
+
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                self.skipped += 1
+
+    def sample(self, elapsed):
+        self.memory.append((elapsed, rss()))
+
+    def report(self, elapsed, server):
+        mb = 1024 * 1024
+        memory = [value for _, value in self.memory]
+
+        return dict(
+            duration=round(elapsed, 3),
+            pushes=self.pushes,
+            failures=self.failures,
+            errors=self.errors,
+            pushes_per_second=round(self.pushes / elapsed, 3),
+            dropped=self.missed + self.skipped,
+            missed=self.missed,
+            skipped=self.skipped,
+            lag_p50=percentile(self.lags, 50),
+            lag_p95=percentile(self.lags, 95),
+            lag_max=percentile(self.lags, 100),
+            latency_p50=percentile(self.latencies, 50),
+            latency_p95=percentile(self.latencies, 95),
+            latency_max=percentile(self.latencies, 100),
+            memory_start_mb=round(memory[0] / mb, 3),
+            memory_end_mb=round(memory[-1] / mb, 3),
+            memory_peak_mb=round(max(memory) / mb, 3),
+            memory_growth_mb_per_minute=round(
+                slope(self.memory) * 60 / mb,
+                3,
+            ),
+            statuses={
+                str(status): count
+                for status, count in sorted(server.statuses.items())
+            },
+        )
+
+
+def run(context, filename, server, duration, interval=1, workers=0):
+    app = App(server.url, 'soak', 'soak', context, filename)
+    app.daemonized = True
+
+    stats = Stats()
+    scheduler = app.scheduler(workers)
+    scheduler.add_listener(
+        stats.listen,
+        EVENT_JOB_SUBMITTED
+        | EVENT_JOB_EXECUTED
+        | EVENT_JOB_ERROR
+        | EVENT_JOB_MISSED
+        | EVENT_JOB_MAX_INSTANCES,
+    )
+
+    thread = Thread(
+        target=app.start,
+        kwargs=dict(sync=False, scheduler=scheduler, workers=workers),
+        daemon=True,
+    )
+
+    started = time.monotonic()
+    stats.sample(0)
+    thread.start()
+
+    while True:
+        elapsed = time.monotonic() - started
+
+        if elapsed >= duration:
+            break
+
+        time.sleep(min(interval, duration - elapsed))
+        stats.sample(time.monotonic() - started)
+
+    scheduler.shutdown()
+    thread.join()
+
+    return stats.report(time.monotonic() - started, server)
+
+
+@click.command()
+@click.option('--datasets', default=100, help="The number of datasets.")
+@click.option('--rows', default=10000, help="The number of source rows.")
+@click.option('--schedule', default='30 seconds', help="The scheduling rule.")
+@click.option('--duration', default=300, help="The run duration in seconds.")
+@click.option('--latency', default=0.05, help="The API latency in seconds.")
+@click.option('--error-rate', default=0.0, help="The API 500 error rate.")
+@click.option('--throttle-rate', default=0.0, help="The API 429 rate.")
+@click.option('--workers', default=0, help="The number of worker processes.")
+@click.option('--directory', default=None, help="The working directory.")
+@click.option('--report', default=None, help="The JSON report file path.")
+@click.option('--verbose', is_flag=True)
+@click.pass_context
+def soak(
+    context,
+    datasets,
+    rows,
+    schedule,
+    duration,
+    latency,
+    error_rate,
+    throttle_rate,
+    workers,
+    directory,
+    report,
+    verbose,
+):
+    """Run the daemon against a local stand-in API and report its load."""
+    if not verbose:
+        for name in ('vizbee', 'apscheduler'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    if directory is None:
+        directory = mkdtemp(prefix='vizbee-soak-')
+
+    filename = generate(directory, datasets, rows, schedule)
+
+    click.echo(f"Soaking {datasets} datasets every {schedule} for {duration}s")
+
+    with StandInServer(
+        latency=latency,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+    ) as server:
+        results = run(context, filename, server, duration, workers=workers)
+
+    for key, value in results.items():
+        click.echo(f"{key}: {value}")
+
+    if report is not None:
+        with open(report, 'w') as f:
+            f.write(dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    soak.main()
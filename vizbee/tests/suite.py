@@ -1,13 +1,38 @@
 import os
+import re
+import time
+import pstats
+import click
 import records
+import requests
 import responses
+import simplejson
 
-from tempfile import mkstemp
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from itertools import chain, repeat
+from tempfile import mkdtemp, mkstemp
+from threading import Thread
 from unittest import TestCase
+from unittest.mock import patch
+from apscheduler.events import EVENT_JOB_EXECUTED, JobExecutionEvent
 from click.testing import CliRunner
+from sqlalchemy.exc import DatabaseError, DBAPIError
 
 from ..cli import cli
-from ..app import API_URL
+from ..admission import Admission
+from ..app import API_URL, App
+from ..connection import Connection
+from ..health import Breaker, Unavailable
+from ..params import PARAM, LastRun, evaluate
+from ..results import Budget, Buffer, LimitExceeded, Results, size
+from ..ratelimit import TokenBucket
+from ..tracing import FileExporter, Tracer
+from .. import workers
+from ..workers import Pool
+from ..server import StandInServer
+from ..soak import Stats, soak
 
 
 class CliTest(TestCase):
@@ -49,6 +74,15 @@ class CliTest(TestCase):
             **kwargs
         )
 
+    def app(self, filename='vizbee/tests/files/vizbee.yml', url=API_URL):
+        return App(
+            url,
+            '<client_id>',
+            '<client_secret>',
+            click.Context(cli),
+            filename,
+        )
+
     def invoke(self, command, *args, filename='vizbee/tests/files/vizbee.yml'):
         return self.runner.invoke(
             cli, [
@@ -176,6 +210,140 @@ class DatasetTest(CliTest):
             result.output,
         )
 
+    def test_execute_json(self):
+        result = self.invoke('dataset', 'execute', 'daily-users', '--json')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn(
+            '{"count(username)": 2, "day": "2017-01-21"}',
+            result.output,
+        )
+
+    def test_execute_csv(self):
+        result = self.invoke(
+            'dataset',
+            'execute',
+            'daily-users',
+            '--format',
+            'csv',
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(
+            "count(username),day\n1,2017-01-20\n2,2017-01-21\n",
+            result.stdout,
+        )
+
+    def test_execute_ndjson_limit(self):
+        result = self.invoke(
+            'dataset',
+            'execute',
+            'daily-users',
+            '--format',
+            'ndjson',
+            '--limit',
+            '1',
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(
+            '{"count(username)": 1, "day": "2017-01-20"}\n',
+            result.stdout,
+        )
+
+    def test_execute_output_sample(self):
+        output = os.path.join(mkdtemp(), 'users.tsv')
+        result = self.invoke(
+            'dataset',
+            'execute',
+            'daily-users',
+            '--format',
+            'tsv',
+            '--sample',
+            '0',
+            '--output',
+            output,
+        )
+        self.assertEqual(result.exit_code, 0)
+
+        with open(output, 'r') as f:
+            self.assertEqual("count(username)\tday\n", f.read())
+
+    def test_execute_all(self):
+        report = os.path.join(mkdtemp(), 'report.json')
+        result = self.invoke(
+            'dataset',
+            'execute',
+            '*-users',
+            '--all',
+            '--jobs',
+            '2',
+            '--report',
+            report,
+            filename='vizbee/tests/files/many-datasets.yml',
+        )
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("dataset", result.output)
+        self.assertIn("no such column: unknown", result.output)
+
+        with open(report, 'r') as f:
+            report = simplejson.load(f)
+
+        timings = {
+            timing['dataset']: timing for timing in report['datasets']
+        }
+        self.assertEqual(
+            sorted(timings),
+            ['all-users', 'daily-users', 'failing-users'],
+        )
+        self.assertEqual(timings['all-users']['rows'], 3)
+        self.assertEqual(timings['daily-users']['rows'], 2)
+        self.assertEqual(
+            timings['daily-users']['bytes'],
+            2 * len('{"count(username)": 1, "day": "2017-01-20"}'),
+        )
+        self.assertIsNone(timings['all-users']['error'])
+
+    def test_execute_all_no_match(self):
+        result = self.invoke('dataset', 'execute', 'unknown-*', '--all')
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("No dataset matching `unknown-*`", result.output)
+
+    def test_execute_params(self):
+        os.environ['SNAPSHOTS'] = mkdtemp()
+        result = self.invoke(
+            'dataset',
+            'execute',
+            'recent-users',
+            '--format',
+            'csv',
+            filename='vizbee/tests/files/params.yml',
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual("username\njeanne\njohn\n", result.stdout)
+
+    def test_last_run(self):
+        os.environ['SNAPSHOTS'] = mkdtemp()
+        filename = 'vizbee/tests/files/params.yml'
+        started = datetime(2017, 1, 21, 9, 30, 0, 1234)
+
+        app = self.app(filename)
+        app.datasets['recent-users'].last_run = started
+
+        app = self.app(filename)
+        self.assertEqual(app.datasets['recent-users'].last_run, started)
+        self.assertEqual(
+            app.datasets['recent-users'].bind()['until'],
+            started,
+        )
+
+    def test_execute_fetch_options(self):
+        result = self.invoke(
+            'dataset',
+            'execute',
+            'users',
+            filename='vizbee/tests/files/fetch-options.yml',
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("jeanne  \njohn    \npaul    \n", result.output)
+
     def test_list(self):
         result = self.invoke('dataset', 'list')
         self.assertEqual(result.exit_code, 0)
@@ -227,6 +395,26 @@ class DatasetTest(CliTest):
             result.output,
         )
 
+    @responses.activate
+    def test_push_throttled(self):
+        self.mock_server(
+            '/datasets/daily-users',
+            status=429,
+            headers={'Retry-After': '0'},
+        )
+        self.mock_server(
+            '/datasets/daily-users',
+            json=dict(url='/an/url'),
+            status=201,
+        )
+        result = self.invoke('dataset', 'push', 'daily-users')
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(len(responses.calls), 2)
+        self.assertIn(
+            "Successfully created `daily-users`: /an/url",
+            result.output,
+        )
+
     @responses.activate
     def test_push_server_error(self):
         self.mock_server(
@@ -356,3 +544,928 @@ class DashboardTest(CliTest):
             ]),
             result.output,
         )
+
+
+class ResultsTest(CliTest):
+    def test_rows(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        results = connection.query(
+            "select username, created_at from user order by username;"
+        )
+        self.assertEqual(results.columns, ('username', 'created_at'))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(
+            results.rows[0],
+            ('jeanne', '2017-01-21 13:56:23'),
+        )
+        self.assertEqual(
+            results.dict[-1],
+            dict(username='paul', created_at='2017-01-20 12:28:59'),
+        )
+
+    def test_fetch_size(self):
+        connection = Connection(
+            os.environ['DATABASE_URL'],
+            fetch_size=2,
+            server_side=True,
+        )
+        results = connection.query("select username from user;", fetch_size=1)
+        self.assertEqual(len(results), 3)
+
+    def test_params(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        query = "select username from user where username = :username;"
+
+        for username in ('paul', 'john'):
+            results = connection.query(query, params=dict(username=username))
+            self.assertEqual(results.rows, [(username,)])
+
+    def test_encode(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        budget = Budget(1024 ** 2)
+        results = connection.query(
+            "select username from user order by username;",
+            budget=budget,
+        )
+
+        with results.encode({}, budget) as f:
+            self.assertIsInstance(f, Buffer)
+            self.assertEqual(budget.used, results.reserved + f.reserved)
+            body = f.getvalue()
+
+        # the encoded payload does not fit next to the rows anymore
+        budget.limit = budget.used
+
+        with results.encode({}, budget) as f:
+            self.assertNotIsInstance(f, Buffer)
+            f.seek(0)
+            self.assertEqual(f.read(), body)
+
+        results.close()
+        self.assertEqual(budget.used, 0)
+        self.assertEqual(
+            simplejson.loads(body),
+            dict(data=[
+                dict(username='jeanne'),
+                dict(username='john'),
+                dict(username='paul'),
+            ]),
+        )
+
+    def test_limited_stream(self):
+        connection = Connection(os.environ['DATABASE_URL'], fetch_size=2)
+        # sqlite ignores stream_results, check what a server side backend
+        # would be given
+        connection.backend = 'postgresql'
+        fetch = Results.fetch
+        options = []
+
+        def record(stream, **limits):
+            options.append(stream.cursor.context.execution_options)
+            return fetch(stream, **limits)
+
+        query = "select username from user;"
+
+        with patch.object(Results, 'fetch', side_effect=record):
+            connection.query(query)
+            connection.query(query, max_rows=10)
+            connection.query(query, budget=Budget(1024))
+            connection.query(query, budget=Budget())
+
+        self.assertEqual(
+            [option.get('stream_results', False) for option in options],
+            [False, True, True, False],
+        )
+        self.assertEqual(options[1]['max_row_buffer'], 2)
+
+    def test_spill(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        results = connection.query(
+            "select username from user order by username;",
+            fetch_size=2,
+            memory=1,
+        )
+        self.assertIsNotNone(results.spill)
+        self.assertEqual(results.rows, [])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(
+            list(results),
+            [('jeanne',), ('john',), ('paul',)],
+        )
+        results.close()
+
+    def test_budget(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        budget = Budget(size('1KB'))
+        results = connection.query("select username from user;", budget=budget)
+        self.assertIsNone(results.spill)
+        self.assertGreater(budget.used, 0)
+        results.close()
+        self.assertEqual(budget.used, 0)
+
+        budget = Budget(1)
+        results = connection.query("select username from user;", budget=budget)
+        self.assertIsNotNone(results.spill)
+        self.assertEqual(budget.used, 0)
+
+    def test_limits(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+
+        with self.assertRaises(LimitExceeded):
+            connection.query("select * from user;", fetch_size=1, max_rows=2)
+
+        with self.assertRaises(LimitExceeded):
+            connection.query("select * from user;", max_bytes=10)
+
+    def test_no_rows(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        results = connection.query("delete from user where 0;")
+        self.assertEqual(results.columns, ())
+        self.assertEqual(results.dict, [])
+
+
+class LimitsTest(CliTest):
+    def invoke(self, *args):
+        return super().invoke(*args, filename='vizbee/tests/files/limits.yml')
+
+    def test_max_rows(self):
+        result = self.invoke('dataset', 'push', 'limited-users')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn(
+            "More than 2 rows fetched, skipping `limited-users`",
+            click.unstyle(result.output),
+        )
+
+    def test_spilled_push(self):
+        with StandInServer() as server:
+            os.environ['API_URL'] = server.url
+            result = self.invoke('dataset', 'push', 'spilled-users')
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(
+            server.items['datasets']['spilled-users']['data'],
+            [
+                dict(username='jeanne'),
+                dict(username='john'),
+                dict(username='paul'),
+            ],
+        )
+
+
+class AsyncTest(CliTest):
+    def async_app(self, url, filename='vizbee/tests/files/vizbee.yml'):
+        from ..aio import AsyncApp
+
+        return AsyncApp(self.app(filename, url))
+
+    def test_sync(self):
+        with StandInServer(throttle_rate=0.5, retry_after=0) as server:
+            app = self.async_app(server.url)
+            app.app.rate_limiter.retries = 20
+            self.assertTrue(app.run(app.sync()))
+
+        self.assertEqual(
+            server.items['datasets']['daily-users']['data'],
+            [
+                {'count(username)': 1, 'day': '2017-01-20'},
+                {'count(username)': 2, 'day': '2017-01-21'},
+            ],
+        )
+        self.assertEqual(
+            server.items['dashboards']['main-report']['datasets'],
+            ['daily-users'],
+        )
+
+    def test_patch(self):
+        os.environ['SNAPSHOTS'] = mkdtemp()
+
+        with StandInServer() as server:
+            app = self.async_app(server.url, 'vizbee/tests/files/keyed.yml')
+            dataset = app.app.datasets['daily-users']
+            self.assertTrue(app.run(app.push(dataset)))
+            self.assertIsNotNone(dataset.last_run)
+
+        data = server.items['datasets']['daily-users']['data']
+        self.assertEqual(len(data), 2)
+
+    def test_spilled_retry(self):
+        throttles = chain([0], repeat(1))
+
+        with StandInServer(throttle_rate=0.5, retry_after=0) as server, \
+                patch('vizbee.server.random.random', lambda: next(throttles)):
+            app = self.async_app(server.url, 'vizbee/tests/files/limits.yml')
+            dataset = app.app.datasets['spilled-users']
+            self.assertTrue(app.run(app.push(dataset)))
+
+        self.assertEqual(server.statuses, {429: 1, 201: 1})
+        self.assertEqual(
+            server.items['datasets']['spilled-users']['data'],
+            [
+                dict(username='jeanne'),
+                dict(username='john'),
+                dict(username='paul'),
+            ],
+        )
+
+
+class WorkersTest(CliTest):
+    @responses.activate
+    def test_push(self):
+        self.mock_server(
+            '/datasets/daily-users',
+            json=dict(url='/an/url'),
+            status=201,
+        )
+        app = self.app()
+        app.pool = Pool(app.connection_options, 2)
+
+        try:
+            self.assertTrue(app.datasets['daily-users'].push())
+
+        finally:
+            app.pool.shutdown()
+
+        self.assertEqual(
+            simplejson.loads(responses.calls[0].request.body),
+            dict(
+                name=None,
+                graph=dict(title='Daily user'),
+                query=app.datasets['daily-users'].query,
+                data=[
+                    {'count(username)': 1, 'day': '2017-01-20'},
+                    {'count(username)': 2, 'day': '2017-01-21'},
+                ],
+            ),
+        )
+
+    def test_soak(self):
+        directory = mkdtemp()
+        report = os.path.join(directory, 'report.json')
+        result = CliRunner().invoke(
+            soak, [
+                '--datasets', '3',
+                '--rows', '100',
+                '--schedule', '1 seconds',
+                '--duration', '2',
+                '--latency', '0',
+                '--workers', '2',
+                '--directory', directory,
+                '--report', report,
+            ],
+            catch_exceptions=False,
+        )
+        self.assertEqual(result.exit_code, 0)
+
+        with open(report, 'r') as f:
+            report = simplejson.load(f)
+
+        self.assertGreater(report['pushes'], 0)
+        self.assertEqual(report['errors'], 0)
+
+    def test_spilled_push(self):
+        app = self.app('vizbee/tests/files/limits.yml')
+        app.pool = Pool(app.connection_options, 2, 2)
+        self.assertEqual(app.pool.memory, 1)
+
+        try:
+            with StandInServer() as server:
+                app.api_url = server.url
+                self.assertTrue(app.datasets['spilled-users'].push())
+
+        finally:
+            app.pool.shutdown()
+
+        self.assertEqual(
+            server.items['datasets']['spilled-users']['data'],
+            [
+                dict(username='jeanne'),
+                dict(username='john'),
+                dict(username='paul'),
+            ],
+        )
+
+    def test_broken_pool(self):
+        app = self.app()
+        app.pool = Pool(app.connection_options, 2)
+        broken = app.pool.executor
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+
+        try:
+            with StandInServer() as server:
+                app.api_url = server.url
+                dataset = app.datasets['daily-users']
+
+                with patch.object(broken, 'submit', return_value=future):
+                    self.assertFalse(dataset.push())
+
+                self.assertIsNot(app.pool.executor, broken)
+                self.assertTrue(dataset.push())
+
+        finally:
+            app.pool.shutdown()
+
+        self.assertEqual(
+            len(server.items['datasets']['daily-users']['data']),
+            2,
+        )
+
+    def test_health(self):
+        directory = os.path.join(mkdtemp(), 'missing')
+        os.environ['DATABASE_URL'] = f"sqlite:///{directory}/db.sqlite"
+        app = self.app('vizbee/tests/files/health.yml')
+        app.pool = Pool(app.connection_options, 1, health=app.health)
+        dataset = app.datasets['users']
+        breaker = dataset.connection.breaker
+
+        try:
+            for _ in range(2):
+                with self.assertRaises(DatabaseError):
+                    app.pool.encode(dataset)
+
+            # the worker opens its circuit after the configured threshold
+            with self.assertRaises(Unavailable):
+                app.pool.encode(dataset)
+
+        finally:
+            app.pool.shutdown()
+
+        self.assertEqual(breaker.failures, 2)
+        self.assertFalse(breaker.closed)
+
+    def encode(self, memory):
+        # forked workers of later tests must not inherit this connection
+        self.addCleanup(workers.connections.clear)
+
+        result, outcomes = workers.encode(
+            'default',
+            dict(url=os.environ['DATABASE_URL']),
+            {},
+            "select username from user;",
+            None,
+            None,
+            {},
+            {},
+            memory,
+            {},
+        )
+        self.assertEqual(outcomes, [True])
+        return result
+
+    def test_budget(self):
+        rows, size, body = self.encode(None)
+        self.assertEqual(rows, 3)
+        self.assertEqual(len(body), size)
+
+        rows, size, path = self.encode(1)
+        self.assertEqual(rows, 3)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+        os.remove(path)
+
+
+class SoakTest(TestCase):
+    def test_health_checks(self):
+        stats = Stats()
+        run_time = datetime.now(timezone.utc)
+
+        for job_id in ('health-default', 'dataset-a'):
+            stats.listen(JobExecutionEvent(
+                EVENT_JOB_EXECUTED,
+                job_id,
+                'default',
+                run_time,
+                retval=True,
+            ))
+
+        self.assertEqual(stats.pushes, 1)
+        self.assertEqual(stats.failures, 0)
+        self.assertEqual(len(stats.latencies), 1)
+
+    def test_server_throttle(self):
+        with StandInServer(throttle_rate=1, retry_after=3) as server:
+            response = requests.put(f"{server.url}/datasets/users", json={})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '3')
+
+    def test_soak(self):
+        directory = mkdtemp()
+        report = os.path.join(directory, 'report.json')
+        result = CliRunner().invoke(
+            soak, [
+                '--datasets', '3',
+                '--rows', '100',
+                '--schedule', '1 seconds',
+                '--duration', '2',
+                '--latency', '0',
+                '--directory', directory,
+                '--report', report,
+            ],
+            catch_exceptions=False,
+        )
+        self.assertEqual(result.exit_code, 0)
+
+        with open(report, 'r') as f:
+            report = simplejson.load(f)
+
+        self.assertGreater(report['pushes'], 0)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['statuses']['201'], 3)
+
+
+class TokenBucketTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.bucket = TokenBucket(
+            rate=2,
+            burst=2,
+            clock=lambda: self.now,
+            sleep=self.sleep,
+        )
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def test_acquire(self):
+        waited = [self.bucket.acquire() for _ in range(4)]
+        self.assertEqual(waited, [0, 0, 0.5, 0.5])
+
+    def test_throttle(self):
+        self.bucket.throttle(3)
+        self.assertEqual(self.bucket.rate, 1)
+        self.assertEqual(self.bucket.acquire(), 3)
+
+    def test_recover(self):
+        self.bucket.throttle()
+        self.bucket.recover()
+        self.assertEqual(self.bucket.rate, 1.2)
+        self.bucket.recover(remaining=10, reset=20)
+        self.assertEqual(self.bucket.rate, 0.5)
+        self.bucket.recover(remaining=0, reset=5)
+        self.assertEqual(self.bucket.acquire(), 5)
+
+    def test_unconfigured(self):
+        bucket = TokenBucket(clock=lambda: self.now, sleep=self.sleep)
+
+        for _ in range(5):
+            self.assertEqual(bucket.acquire(), 0)
+            self.now += 0.25
+
+        bucket.throttle()
+        self.assertEqual(bucket.rate, 2)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0, 0.5, 0.5])
+
+        bucket.recover()
+        self.assertAlmostEqual(bucket.rate, 2.4)
+
+    def test_unconfigured_headers(self):
+        bucket = TokenBucket(clock=lambda: self.now, sleep=self.sleep)
+        bucket.recover(remaining=10, reset=20)
+        self.assertEqual(bucket.rate, 0.5)
+        bucket.recover()
+        self.assertAlmostEqual(bucket.rate, 0.55)
+        bucket.throttle()
+        self.assertAlmostEqual(bucket.rate, 0.275)
+        bucket.recover()
+        self.assertAlmostEqual(bucket.rate, 0.33)
+
+
+class AdmissionTest(CliTest):
+    def setUp(self):
+        super().setUp()
+        self.now = 0
+        self.admission = Admission(
+            limit=2,
+            max_limit=3,
+            clock=lambda: self.now,
+        )
+
+    def run_query(self, latency, key='users'):
+        started = self.admission.acquire()
+        self.now += latency
+        self.admission.release(started, key, latency=latency)
+
+    def test_increase(self):
+        started = self.admission.acquire()
+
+        for _ in range(4):
+            self.run_query(1)
+
+        self.admission.release(started)
+        self.assertEqual(self.admission.limit, 3)
+
+    def test_decrease(self):
+        first = self.admission.acquire()
+        second = self.admission.acquire()
+        self.admission.release(first, error=True)
+        self.admission.release(second, error=True)
+        self.assertEqual(self.admission.limit, 1)
+
+        self.run_query(1)
+        self.run_query(3)
+        self.assertEqual(self.admission.limit, 1)
+        self.assertEqual(self.admission.latencies['users'], 1.4)
+
+    def test_priority(self):
+        self.admission.limit = 1
+        started = self.admission.acquire()
+        admitted = []
+
+        def run(priority):
+            self.admission.release(self.admission.acquire(priority))
+            admitted.append(priority)
+
+        threads = [Thread(target=run, args=(p,)) for p in (0, 5, 1)]
+
+        for thread in threads:
+            thread.start()
+
+        while len(self.admission.waiting) < 3:
+            time.sleep(0.01)
+
+        self.admission.release(started)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(admitted, [5, 1, 0])
+
+    def test_timeout(self):
+        app = self.app('vizbee/tests/files/admission.yml')
+        admission = app.connections['default'].admission
+        started = admission.acquire()
+
+        # the busy connection does not hold the only scheduler thread
+        with ThreadPoolExecutor(1) as executor:
+            results = list(executor.map(
+                lambda dataset: dataset.execute(),
+                app.datasets.values(),
+            ))
+
+        admission.release(started)
+        self.assertIsNone(results[0])
+        self.assertEqual(len(results[1]), 3)
+        self.assertEqual(admission.waiting, [])
+
+    def test_execute(self):
+        app = self.app('vizbee/tests/files/health.yml')
+        dataset = app.datasets['users']
+        self.assertEqual(dataset.priority, 1)
+        self.assertEqual(len(dataset.execute()), 3)
+
+        admission = dataset.connection.admission
+        self.assertEqual(admission.inflight, 0)
+        self.assertEqual(list(admission.latencies), ['users'])
+
+
+class ProfileTest(CliTest):
+    def test_profile(self):
+        output = os.path.join(mkdtemp(), 'vizbee.prof')
+        result = self.runner.invoke(
+            cli, [
+                '--config',
+                'vizbee/tests/files/vizbee.yml',
+                '--profile',
+                '--profile-output',
+                output,
+                '--profile-top',
+                '5',
+                'dataset',
+                'execute',
+                'daily-users',
+            ],
+            catch_exceptions=False,
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn(f"Profile written to {output}", result.output)
+
+        for subsystem in ('config', 'db', 'serialize', 'http', 'other'):
+            self.assertRegex(result.output, rf'\n{subsystem} *\|')
+
+        stats = pstats.Stats(output)
+        self.assertTrue(any(
+            name == 'stream' and filename.endswith('connection.py')
+            for filename, line, name in stats.stats
+        ))
+
+
+class BreakerTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = Breaker(
+            threshold=2,
+            backoff=1,
+            max_backoff=3,
+            clock=lambda: self.now,
+        )
+
+    def test_open(self):
+        self.breaker.failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_backoff(self):
+        delays = []
+
+        for _ in range(5):
+            self.breaker.failure()
+            delays.append(self.breaker.delay)
+
+        self.assertEqual(delays, [1, 1, 2, 3, 3])
+        self.breaker.success()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.delay, 1)
+
+    def test_resume(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.defer('users')
+        self.breaker.defer('users')
+        self.assertEqual(self.breaker.resume(), [])
+        self.breaker.success()
+        self.assertEqual(self.breaker.resume(), ['users'])
+        self.assertEqual(self.breaker.resume(), [])
+
+
+class HealthTest(CliTest):
+    def test_defer(self):
+        directory = os.path.join(mkdtemp(), 'missing')
+        os.environ['DATABASE_URL'] = f"sqlite:///{directory}/db.sqlite"
+        app = self.app('vizbee/tests/files/health.yml')
+        connection = app.connections['default']
+        connection.breaker.clock = lambda: self.now
+        dataset = app.datasets['users']
+        self.now = 0
+
+        for _ in range(2):
+            with self.assertRaises(DatabaseError):
+                connection.query(dataset.query)
+
+        with self.assertRaises(Unavailable):
+            connection.query(dataset.query)
+
+        self.assertFalse(dataset.push())
+        self.assertEqual(connection.breaker.deferred, [dataset])
+
+        jobs = []
+        scheduler = type('Scheduler', (), dict(add_job=jobs.append))
+
+        self.now = 60
+        app.check(connection, scheduler)
+        self.assertEqual(jobs, [])
+        self.assertEqual(connection.breaker.retry_at, 180)
+
+        os.mkdir(directory)
+        app.check(connection, scheduler)
+        self.assertEqual(jobs, [])
+
+        self.now = 180
+        app.check(connection, scheduler)
+        self.assertEqual(jobs, [dataset.job])
+        self.assertTrue(connection.breaker.closed)
+
+
+    def test_ping(self):
+        connection = Connection(os.environ['DATABASE_URL'])
+        error = DBAPIError(
+            'SELECT 1',
+            {},
+            Exception("Connection lost"),
+            connection_invalidated=True,
+        )
+
+        with patch.object(connection.engine, 'connect', side_effect=error):
+            self.assertEqual(connection.ping(), "Connection lost")
+
+        self.assertEqual(connection.breaker.failures, 1)
+        self.assertIsNone(connection.ping())
+        self.assertEqual(connection.breaker.failures, 0)
+
+
+class PatchTest(CliTest):
+    def setUp(self):
+        super().setUp()
+        os.environ['SNAPSHOTS'] = mkdtemp()
+        self.server = StandInServer().start()
+        os.environ['API_URL'] = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def push(self):
+        return self.invoke(
+            'dataset',
+            'push',
+            'daily-users',
+            filename='vizbee/tests/files/keyed.yml',
+        )
+
+    def data(self):
+        data = self.server.items['datasets']['daily-users']['data']
+        return sorted((row['day'], row['users']) for row in data)
+
+    def test_patch(self):
+        result = self.push()
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Successfully created `daily-users`", result.output)
+
+        self.db.query("""
+            insert into user(username, created_at)
+            values ("pierre", "2017-01-22 10:00:00");
+        """)
+        result = self.push()
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Patching: `daily-users` (+1 ~0 -0)", result.output)
+        self.assertEqual(
+            self.data(),
+            [('2017-01-20', 1), ('2017-01-21', 2), ('2017-01-22', 1)],
+        )
+
+        self.db.query("delete from user where username = 'john';")
+        result = self.push()
+        self.assertIn("Patching: `daily-users` (+0 ~1 -0)", result.output)
+
+        self.db.query("delete from user where username = 'paul';")
+        result = self.push()
+        self.assertIn("Patching: `daily-users` (+0 ~0 -1)", result.output)
+        self.assertEqual(self.data(), [('2017-01-21', 1), ('2017-01-22', 1)])
+        self.assertEqual(self.server.statuses[200], 3)
+
+    def test_fallback(self):
+        self.push()
+        del self.server.items['datasets']['daily-users']
+
+        self.db.query("""
+            insert into user(username, created_at)
+            values ("pierre", "2017-01-22 10:00:00");
+        """)
+        result = self.push()
+        self.assertIn("Patch rejected, falling back", result.output)
+        self.assertIn("Successfully created `daily-users`", result.output)
+        self.assertEqual(
+            self.data(),
+            [('2017-01-20', 1), ('2017-01-21', 2), ('2017-01-22', 1)],
+        )
+
+    def test_duplicate_key(self):
+        for _ in range(2):
+            result = self.invoke(
+                'dataset',
+                'push',
+                'user-days',
+                filename='vizbee/tests/files/keyed.yml',
+            )
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn(
+                "Duplicate key {'day': '2017-01-21'} in `user-days`",
+                result.output,
+            )
+            self.assertNotIn("Patching", result.output)
+
+        data = self.server.items['datasets']['user-days']['data']
+        self.assertEqual(
+            sorted(row['username'] for row in data),
+            ['jeanne', 'john', 'paul'],
+        )
+        self.assertEqual(self.server.statuses[200], 1)
+
+    def test_larger_patch(self):
+        self.push()
+        self.db.query("update user set created_at = '2017-02-01 00:00:00';")
+        result = self.push()
+        self.assertNotIn("Patching", result.output)
+        self.assertIn("Successfully updated `daily-users`", result.output)
+        self.assertEqual(self.data(), [('2017-02-01', 3)])
+
+
+class TracingTest(CliTest):
+    def spans(self, path):
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines[0], '[')
+        return [simplejson.loads(line.rstrip(',')) for line in lines[1:]]
+
+    @responses.activate
+    def test_push(self):
+        path = os.path.join(mkdtemp(), 'traces.json')
+        os.environ['TRACES'] = path
+        self.mock_server(
+            '/datasets/daily-users',
+            json=dict(url='/an/url'),
+            status=201,
+        )
+        result = self.invoke(
+            'dataset',
+            'push',
+            'daily-users',
+            filename='vizbee/tests/files/tracing.yml',
+        )
+        self.assertEqual(result.exit_code, 0)
+
+        spans = {span['name']: span for span in self.spans(path)}
+        self.assertEqual(
+            sorted(spans),
+            [
+                'dataset.execute',
+                'db.checkout',
+                'db.execute',
+                'http.request',
+                'serialize',
+            ],
+        )
+        execute = spans['dataset.execute']
+        self.assertEqual(execute['ph'], 'X')
+        self.assertEqual(execute['args']['dataset'], 'daily-users')
+        self.assertEqual(execute['args']['connection'], 'default')
+        self.assertEqual(execute['args']['rows'], 2)
+        self.assertEqual(
+            spans['db.checkout']['args']['parent_id'],
+            execute['args']['span_id'],
+        )
+        self.assertEqual(spans['http.request']['args']['status'], 201)
+        self.assertGreater(spans['serialize']['args']['bytes'], 0)
+
+    def test_sample(self):
+        path = os.path.join(mkdtemp(), 'traces.json')
+        tracer = Tracer()
+        tracer.configure(path, sample=0)
+
+        with tracer.span('root'):
+            with tracer.span('child') as span:
+                self.assertFalse(span.sampled)
+
+        self.assertEqual(self.spans(path), [])
+
+    def test_rotate(self):
+        path = os.path.join(mkdtemp(), 'traces.json')
+        tracer = Tracer()
+        tracer.exporter = FileExporter(path, max_bytes=300, backup_count=2)
+
+        for index in range(10):
+            with tracer.span('span', index=index):
+                pass
+
+        self.assertTrue(os.path.exists(f'{path}.1'))
+        self.assertTrue(os.path.exists(f'{path}.2'))
+        self.assertFalse(os.path.exists(f'{path}.3'))
+        self.assertEqual(self.spans(path)[-1]['args']['index'], 9)
+
+
+class ParamsTest(TestCase):
+    now = datetime(2017, 1, 21, 13, 56, 23)
+
+    def evaluate(self, value, last_run=None):
+        return evaluate(value, last_run=last_run, now=self.now)
+
+    def test_literal(self):
+        self.assertEqual(self.evaluate(7), 7)
+        self.assertEqual(self.evaluate("paul"), "paul")
+        self.assertEqual(self.evaluate("black or white"), "black or white")
+        self.assertEqual(self.evaluate("now or never"), "now or never")
+
+    def test_expression(self):
+        self.assertEqual(self.evaluate("now"), self.now)
+        self.assertEqual(
+            self.evaluate("now - 7 days"),
+            datetime(2017, 1, 14, 13, 56, 23),
+        )
+        self.assertEqual(
+            self.evaluate("today + 2 hours"),
+            datetime(2017, 1, 21, 2),
+        )
+
+    def test_last_run(self):
+        last_run = datetime(2017, 1, 20)
+        self.assertIsNone(self.evaluate("last_run"))
+        self.assertEqual(
+            self.evaluate("last_run or today"),
+            datetime(2017, 1, 21),
+        )
+        self.assertEqual(
+            self.evaluate("last_run - 1 minutes or today", last_run),
+            datetime(2017, 1, 19, 23, 59),
+        )
+
+    def test_persisted(self):
+        path = os.path.join(mkdtemp(), 'runs', 'users.last_run')
+        self.assertIsNone(LastRun(path).value)
+
+        LastRun(path).value = self.now
+        self.assertEqual(LastRun(path).value, self.now)
+
+    def test_schema(self):
+        pattern = re.compile(f'(?:{PARAM})$')
+
+        for value in ("paul", "black or white", "today's", "last_run or now"):
+            self.assertIsNotNone(pattern.match(value), value)
+
+        for value in ("now - 7 day", "today +", "last_run or tomorrow"):
+            self.assertIsNone(pattern.match(value), value)
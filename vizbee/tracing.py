@@ -0,0 +1,187 @@
+import os
+import random
+import time
+
+from threading import Lock, get_ident, local
+
+from simplejson import dumps
+
+
+MAX_BYTES = 10 * 1024 * 1024
+
+
+class NoopSpan():
+    sampled = False
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NOOP = NoopSpan()
+
+
+class Span():
+    def __init__(self, tracer, name, parent, attributes, sampled=True):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.sampled = sampled
+        self.span_id = f'{random.getrandbits(64):016x}'
+
+        if parent is None:
+            self.trace_id = f'{random.getrandbits(128):032x}'
+            self.parent_id = None
+
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.tracer.stack.append(self)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        duration = time.time() - self.started
+        self.tracer.stack.pop()
+
+        if value is not None:
+            self.attributes.update(status='error', error=str(value))
+
+        if self.sampled:
+            self.tracer.export(self, duration)
+
+        return False
+
+
+class FileExporter():
+    def __init__(self, path, max_bytes=MAX_BYTES, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.open()
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'a')
+
+        # chrome trace event json array, which may be left unterminated
+        if not self.file.tell():
+            self.file.write('[\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def rotate(self):
+        self.close()
+
+        for index in range(self.backup_count - 1, 0, -1):
+            path = f'{self.path}.{index}'
+
+            if os.path.exists(path):
+                os.replace(path, f'{self.path}.{index + 1}')
+
+        if self.backup_count:
+            os.replace(self.path, f'{self.path}.1')
+
+        else:
+            os.remove(self.path)
+
+        self.open()
+
+    def export(self, span, duration):
+        args = dict(
+            span.attributes,
+            trace_id=span.trace_id,
+            span_id=span.span_id,
+            parent_id=span.parent_id,
+        )
+        event = dict(
+            name=span.name,
+            cat='vizbee',
+            ph='X',
+            ts=int(span.started * 1e6),
+            dur=int(duration * 1e6),
+            pid=self.pid,
+            tid=get_ident(),
+            args=args,
+        )
+        line = f'{dumps(event, default=str)},\n'
+
+        with self.lock:
+            size = self.file.tell()
+
+            if size > 2 and size + len(line) > self.max_bytes:
+                self.rotate()
+
+            self.file.write(line)
+            self.file.flush()
+
+
+class Tracer():
+    def __init__(self):
+        self.exporter = None
+        self.sample = 1
+        self.local = local()
+
+    @property
+    def stack(self):
+        try:
+            return self.local.stack
+
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def configure(
+        self,
+        file=None,
+        sample=1,
+        max_bytes=MAX_BYTES,
+        backup_count=5,
+    ):
+        if self.exporter is not None:
+            self.exporter.close()
+
+        self.exporter = None
+        self.sample = sample
+
+        if file is not None:
+            self.exporter = FileExporter(file, max_bytes, backup_count)
+
+    def span(self, name, **attributes):
+        if self.exporter is None:
+            return NOOP
+
+        stack = self.stack
+
+        if stack:
+            parent = stack[-1]
+            sampled = parent.sampled
+
+        else:
+            parent = None
+            sampled = random.random() < self.sample
+
+        return Span(self, name, parent, attributes, sampled)
+
+    def export(self, span, duration):
+        exporter = self.exporter
+
+        if exporter is not None:
+            exporter.export(span, duration)
+
+
+tracer = Tracer()
@@ -0,0 +1,190 @@
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+from .connection import Connection
+from .health import Breaker
+from .results import Budget, Buffer
+from .tracing import tracer
+
+
+# connections and memory budget of the current worker process, opened on
+# first use
+connections = {}
+budgets = {}
+
+
+class WorkerFailed(Exception):
+    pass
+
+
+class Reported(Exception):
+    pass
+
+
+class Reporter(Breaker):
+    # keeps the connection outcomes for the breaker of the parent process
+    def __init__(self, **health):
+        super().__init__(**health)
+        self.outcomes = []
+
+    def success(self):
+        super().success()
+        self.outcomes.append(True)
+
+    def failure(self):
+        super().failure()
+        self.outcomes.append(False)
+
+    def report(self):
+        outcomes, self.outcomes = self.outcomes, []
+        return outcomes
+
+
+def connect(name, options, health):
+    try:
+        return connections[name]
+
+    except KeyError:
+        # do not share the parent trace file with forked workers
+        tracer.configure()
+
+        connection = connections[name] = Connection(
+            name=name,
+            breaker=Reporter(**health),
+            **options
+        )
+        return connection
+
+
+def budget(limit):
+    try:
+        return budgets[limit]
+
+    except KeyError:
+        budget = budgets[limit] = Budget(limit)
+        return budget
+
+
+def encode(name, options, health, *args):
+    connection = connect(name, options, health)
+
+    try:
+        result = _encode(connection, *args)
+
+    except Exception as e:
+        raise Reported(e, connection.breaker.report())
+
+    return result, connection.breaker.report()
+
+
+def _encode(
+    connection,
+    query,
+    fetch_size,
+    server_side,
+    params,
+    limits,
+    memory,
+    payload,
+):
+    results = connection.query(
+        query,
+        fetch_size=fetch_size,
+        server_side=server_side,
+        params=params,
+        budget=budget(memory),
+        **limits
+    )
+
+    try:
+        f = results.encode(
+            payload,
+            budget(memory),
+            partial(NamedTemporaryFile, delete=False),
+        )
+
+    finally:
+        results.close()
+
+    with f:
+        if isinstance(f, Buffer):
+            return len(results), f.tell(), f.getvalue()
+
+        # payloads encoded to disk are handed over by path
+        return len(results), f.tell(), f.name
+
+
+class Pool():
+    def __init__(self, connections, workers, memory=None, health=None):
+        self.connections = connections
+        self.workers = workers
+        self.health = health or {}
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.lock = Lock()
+
+        # each worker process gets an even share of the global budget
+        self.memory = None if memory is None else memory // workers
+
+    def encode(self, dataset):
+        name = dataset.connection.name
+        executor = self.executor
+
+        future = executor.submit(
+            encode,
+            name,
+            self.connections[name],
+            self.health,
+            dataset.query,
+            dataset.fetch_size,
+            dataset.server_side,
+            dataset.bind(),
+            dataset.limits,
+            self.memory,
+            dataset.describe(),
+        )
+
+        try:
+            (rows, size, body), outcomes = future.result()
+
+        except BrokenProcessPool:
+            self.restart(executor)
+            raise WorkerFailed("A worker process died")
+
+        except Reported as e:
+            error, outcomes = e.args
+            self.report(dataset.connection.breaker, outcomes)
+            raise error from None
+
+        self.report(dataset.connection.breaker, outcomes)
+
+        if isinstance(body, str):
+            f = open(body, 'rb')
+            # the open file stays readable until it is closed
+            os.remove(body)
+            body = f
+
+        return rows, size, body
+
+    def report(self, breaker, outcomes):
+        for success in outcomes:
+            if success:
+                breaker.success()
+
+            else:
+                breaker.failure()
+
+    def restart(self, executor):
+        with self.lock:
+            # the runs sharing the broken executor only replace it once
+            if self.executor is executor:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        self.executor.shutdown()